@@ -1,10 +1,18 @@
 import streamlit as st
 import pandas as pd
-from src.database import fetch_all_products, create_sale_record, void_transaction, fetch_shop_settings
+import pyarrow as pa
+import pyarrow.compute as pc
+import uuid
+from collections import Counter
+from src.database import BRANCH_ID, get_catalog_table, get_product, find_product_by_code, create_sale_record, void_transaction, fetch_shop_settings, get_low_stock_alert, search_customers, normalize_phone
 from src.utils import generate_invoice_pdf, get_whatsapp_link
+from src.billing import bill_for_cart, rupees, tax_summary_rupees
+from src.jobs import start_background_jobs
+from src.db_client import is_rejection
 
 # --- 1. PAGE CONFIG ---
 st.set_page_config(page_title="Haveli Billing", layout="wide", initial_sidebar_state="collapsed")
+start_background_jobs()  # once per server process; later calls are no-ops
 
 # --- 2. GLOBAL STYLING ---
 st.markdown("""
@@ -94,6 +102,7 @@ with nav_col1:
     st.markdown('</div>', unsafe_allow_html=True)
 with nav_col2:
     if st.button("📦 Inventory", use_container_width=True):
+        st.session_state.inv_window = None  # show stock as of now, not the grid page read before these sales
         st.switch_page("pages/inventory.py") 
 with nav_col3:
     if st.button("📊 Insights", use_container_width=True):
@@ -107,6 +116,7 @@ st.divider()
 with st.sidebar:
     st.markdown("### 🏮 Admin Panel")
     st.write(f"User: **{st.secrets['ADMIN_USER']}**")
+    st.write(f"Branch: **#{BRANCH_ID}**")
     if st.button("🚪 Logout", use_container_width=True):
         st.session_state.logged_in = False
         st.rerun()
@@ -116,23 +126,70 @@ with st.sidebar:
 # --- 5. BILLING HUB LOGIC WITH STOCK GUARDRAILS ---
 if 'cart' not in st.session_state: st.session_state.cart = []
 if 'last_sale' not in st.session_state: st.session_state.last_sale = None
+# Idempotency base per bill: create_sale_record derives the sent key from it plus the cart, so
+# retries of the same cart reuse the key and an edited cart gets a new one
+if 'sale_key' not in st.session_state: st.session_state.sale_key = str(uuid.uuid4())
+# A Finalize that failed without a clear answer may still have been recorded. Its exact
+# request is kept here and the bill stays locked until a retry (same key, so at most one
+# sale) settles it.
+if 'pending_sale' not in st.session_state: st.session_state.pending_sale = None
 
 def reset_bill():
     st.session_state.cart = []
     st.session_state.last_sale = None
+    st.session_state.pending_sale = None
+    st.session_state.sale_key = str(uuid.uuid4())
+    st.rerun()
+
+def record_sale(sale):
+    """Sends a Finalize request; a success becomes last_sale, an unclear failure locks the bill."""
+    try:
+        sale_id = create_sale_record(sale['phone'], sale['total'], sale['payment_mode'], sale['db_items'],
+                                     st.session_state.sale_key, sale['tax_summary'])
+    except Exception as e:
+        # A refusal (e.g. not enough stock) wrote nothing and the bill can be fixed;
+        # anything else (timeout, dropped connection) may have committed
+        st.session_state.pending_sale = None if is_rejection(e) else sale
+        st.error(f"Transaction failed: {e}")
+        return
+    st.session_state.pending_sale = None
+    st.session_state.last_sale = {"id": sale_id, "total": sale['total'], "phone": sale['phone'],
+                                  "items": sale['pdf_items'], "tax": sale['tax']}
+    st.balloons()
     st.rerun()
 
 try:
     shop_info = fetch_shop_settings()
     shop_name = shop_info.get('shop_name', 'Haveli Electricals')
+    default_gst_rate = float(shop_info.get('tax_percent') or 0)
+    prices_include_tax = shop_info.get('prices_include_tax', True) is not False
 except:
     shop_name = "Haveli Electricals"
+    default_gst_rate, prices_include_tax = 0.0, True
+
+def add_to_cart(product, qty):
+    """Adds or increments a cart line. Returns an error message if stock would be exceeded."""
+    existing_item = next((item for item in st.session_state.cart if item['id'] == product['id']), None)
+    in_cart = existing_item['quantity'] if existing_item else 0
+    if in_cart + qty > product['current_stock']:
+        return f"{product['name']}: only {product['current_stock']} in stock."
+    if existing_item:
+        existing_item['quantity'] += qty
+    else:
+        st.session_state.cart.append({
+            "id": product['id'], "name": product['name'],
+            "quantity": qty, "price": float(product['selling_price']),
+            "cost_price": float(product['cost_price']), "discount": 0.0,
+            "hsn_code": product.get('hsn_code') or "",
+            "gst_rate": float(product['gst_rate']) if product.get('gst_rate') is not None else default_gst_rate,
+        })
+    return None
 
 header_col, action_col = st.columns([5, 1])
 with header_col:
     st.markdown(f"# ⚡ Billing Terminal")
 with action_col:
-    if st.button("🆕 New Bill", use_container_width=True):
+    if st.button("🆕 New Bill", use_container_width=True, disabled=st.session_state.pending_sale is not None):
         reset_bill()
 
 col_left, col_right = st.columns([1, 1.2], gap="large")
@@ -141,49 +198,78 @@ with col_left:
     with st.container(border=True):
         st.markdown("#### 👤 Customer & Payment")
         cust_phone = st.text_input("WhatsApp Number", placeholder="e.g. 9825XXXXXX")
+
+        # Autocomplete regulars from the customer directory by phone prefix
+        if len(cust_phone.strip()) >= 3:
+            matches = search_customers(cust_phone)
+            exact = next((c for c in matches if c['phone'] == normalize_phone(cust_phone)), None)
+            if exact is None and matches:
+                picked = st.selectbox(
+                    "Matching Customers", [None] + matches,
+                    format_func=lambda c: "Select a regular..." if c is None else f"{c['phone']} · {c['visit_count']} visits",
+                )
+                if picked:
+                    cust_phone, exact = picked['phone'], picked
+            if exact:
+                last_seen = pd.to_datetime(exact['last_purchase_at']).strftime('%d %b %Y') if exact['last_purchase_at'] else "-"
+                st.caption(f"🧾 Regular: {exact['visit_count']} visits · ₹{float(exact['lifetime_spend']):,.2f} lifetime · last on {last_seen}")
         payment_mode = st.selectbox("Mode of Payment", ["Cash", "UPI", "Card"])
 
 with col_right:
     with st.container(border=True):
         st.markdown("#### 📦 Add Products")
-        all_products = fetch_all_products()
-        
+        scan_mode = st.toggle("🔫 Scan Mode", help="Scan or type SKU/barcodes. Several codes separated by spaces are added together.")
+
+        if scan_mode and st.session_state.last_sale is None and st.session_state.pending_sale is None:
+            # Enter (or the scanner's trailing newline) submits the form; the whole burst is one cart update
+            with st.form("scan_form", clear_on_submit=True, border=False):
+                scanned = st.text_input("Scan Code", placeholder="Scan barcode / SKU", label_visibility="collapsed")
+                submitted = st.form_submit_button("Add Scanned", use_container_width=True)
+            if submitted and scanned.strip():
+                errors = []
+                for code, count in Counter(scanned.split()).items():
+                    product = find_product_by_code(code)
+                    if product is None:
+                        errors.append(f"Unknown code: {code}")
+                    else:
+                        error = add_to_cart(product, count)
+                        if error:
+                            errors.append(error)
+                for error in errors:
+                    st.error(error)
+
         # GUARDRAIL 1: Filter out products with 0 or negative stock
-        available_products = [p for p in all_products if p['current_stock'] > 0]
-        product_names = [f"{p['name']} (Stock: {p['current_stock']})" for p in available_products]
+        # Labels are built column-wise from the catalog table; rows become dicts only when picked
+        available = get_catalog_table(['id', 'name', 'current_stock'])
+        available = available.filter(pc.greater(available['current_stock'], 0)).sort_by('name')
+        product_ids = available['id'].to_pylist()
+        product_names = pc.binary_join_element_wise(
+            available['name'], " (Stock: ", pc.cast(available['current_stock'], pa.string()), ")", ""
+        ).to_pylist()
         
         selected_display_name = st.selectbox("Search Product", [""] + product_names, label_visibility="collapsed")
         
         q_col, a_col = st.columns([1, 2], gap="medium")
         qty = q_col.number_input("Qty", min_value=1, value=1)
         
-        if st.session_state.last_sale is None:
+        if st.session_state.pending_sale:
+            a_col.info("Confirming last attempt")
+        elif st.session_state.last_sale is None:
             if selected_display_name:
-                # Extract real product name from display string
-                real_name = selected_display_name.split(" (Stock:")[0]
-                prod_details = next(p for p in available_products if p['name'] == real_name)
+                prod_details = get_product(product_ids[product_names.index(selected_display_name)])
                 
-                # LOW STOCK ALERT: Notify if down to last 3 units
-                if 0 < prod_details['current_stock'] <= 3:
-                    st.warning(f"⚠️ Low Stock Alert: Only {prod_details['current_stock']} left!")
+                # LOW STOCK ALERT: Notify once the product is at or below its alert level
+                alert = get_low_stock_alert(prod_details['id'])
+                if alert:
+                    st.warning(f"⚠️ Low Stock Alert: Only {alert['current_stock']} left!")
 
                 # GUARDRAIL 2: Check if requested qty is more than available
                 if qty > prod_details['current_stock']:
                     a_col.error(f"Only {prod_details['current_stock']} left!")
                 elif a_col.button("➕ Add to Cart", use_container_width=True):
-                    existing_item = next((item for item in st.session_state.cart if item['id'] == prod_details['id']), None)
-                    if existing_item:
-                        if (existing_item['quantity'] + qty) > prod_details['current_stock']:
-                            st.error(f"Cannot add more! Total exceeds stock.")
-                        else:
-                            existing_item['quantity'] += qty
-                            st.rerun()
+                    if add_to_cart(prod_details, qty):
+                        st.error(f"Cannot add more! Total exceeds stock.")
                     else:
-                        st.session_state.cart.append({
-                            "id": prod_details['id'], "name": prod_details['name'],
-                            "quantity": qty, "price": float(prod_details['selling_price']),
-                            "cost_price": float(prod_details['cost_price'])
-                        })
                         st.rerun()
         else:
             a_col.info("Bill Finalized")
@@ -193,43 +279,85 @@ if st.session_state.cart:
     st.markdown("#### 📋 Current Bill Details")
     with st.container(border=True):
         cart_df = pd.DataFrame(st.session_state.cart)
-        if st.session_state.last_sale:
-            st.dataframe(cart_df[['name', 'quantity', 'price']], use_container_width=True, hide_index=True)
+        if st.session_state.pending_sale:
+            pending = st.session_state.pending_sale
+            st.dataframe(pd.DataFrame(pending['lines']), use_container_width=True, hide_index=True)
+            total_bill, tax = pending['total'], pending['tax']
+        elif st.session_state.last_sale:
+            st.dataframe(cart_df[['name', 'quantity', 'price', 'discount']], use_container_width=True, hide_index=True)
             total_bill = st.session_state.last_sale['total']
+            tax = st.session_state.last_sale['tax']
         else:
             edited_cart = st.data_editor(
-                cart_df[['name', 'quantity', 'price']],
+                cart_df[['name', 'quantity', 'price', 'discount']],
                 column_config={
                     "name": st.column_config.TextColumn("Product Name", disabled=True),
                     "price": st.column_config.NumberColumn("Rate (Rs.)", format="%.2f"),
-                    "quantity": st.column_config.NumberColumn("Qty")
+                    "quantity": st.column_config.NumberColumn("Qty"),
+                    "discount": st.column_config.NumberColumn("Disc %", min_value=0, max_value=100, format="%.2f")
                 },
                 use_container_width=True, num_rows="dynamic", hide_index=True, key="bill_editor"
             )
-            total_bill = (edited_cart['quantity'] * edited_cart['price']).sum()
+            # Edited qty/rate/discount over the cart's product details (HSN, GST rate)
+            cart_by_name = {item['name']: item for item in st.session_state.cart}
+            edited_rows = [r for r in edited_cart.to_dict('records') if r['name'] in cart_by_name]
+            # Lines with a blank or invalid Qty/Rate stay out of the bill until they are fixed
+            complete_rows = [r for r in edited_rows
+                             if pd.notna(r['quantity']) and pd.notna(r['price']) and r['quantity'] > 0 and r['price'] >= 0]
+            incomplete_count = len(edited_rows) - len(complete_rows)
+            if incomplete_count:
+                st.warning(f"⚠️ {incomplete_count} line(s) need a quantity and rate before the bill can be finalized.")
+            bill_rows = [
+                {**cart_by_name[r['name']], "quantity": int(r['quantity']), "price": r['price'],
+                 "discount": r['discount'] if pd.notna(r['discount']) else 0}
+                for r in complete_rows
+            ]
+            bill_lines, bill_summary, bill_hsn = bill_for_cart(bill_rows, prices_include_tax)
+            total_bill = rupees(bill_summary['grand_total']) if bill_summary else 0.0
+            tax = tax_summary_rupees(bill_summary, bill_hsn) if bill_summary else None
+
+        if tax:
+            t1, t2, t3, t4, t5 = st.columns(5)
+            t1.metric("Discount", f"Rs. {tax['discount']:,.2f}")
+            t2.metric("Taxable", f"Rs. {tax['taxable']:,.2f}")
+            t3.metric("CGST", f"Rs. {tax['cgst']:,.2f}")
+            t4.metric("SGST", f"Rs. {tax['sgst']:,.2f}")
+            t5.metric("Round Off", f"Rs. {tax['round_off']:,.2f}")
         st.markdown(f"""<div class="total-box">Grand Total: Rs. {total_bill:,.2f}</div>""", unsafe_allow_html=True)
 
-    if st.session_state.last_sale is None:
-        if st.button("🚀 FINALIZE TRANSACTION & PRINT", type="primary"):
-            db_sale_items, pdf_sale_items = [], []
-            for _, row in edited_cart.iterrows():
-                original_item = next(item for item in st.session_state.cart if item['name'] == row['name'])
-                db_sale_items.append({"product_id": original_item['id'], "quantity": int(row['quantity']), "price_at_sale": float(row['price'])})
-                pdf_sale_items.append({"name": row['name'], "quantity": int(row['quantity']), "price": float(row['price'])})
-            try:
-                sale_id = create_sale_record(cust_phone, total_bill, payment_mode, db_sale_items)
-                st.session_state.last_sale = {"id": sale_id, "total": total_bill, "phone": cust_phone, "items": pdf_sale_items}
-                st.balloons()
+    if st.session_state.pending_sale:
+        st.warning("⚠️ The last attempt may have been recorded. Retry to confirm it; the sale cannot be booked twice.")
+        r_col, d_col = st.columns([2, 1])
+        if r_col.button("🔁 RETRY FINALIZE", type="primary", use_container_width=True):
+            record_sale(st.session_state.pending_sale)
+        with d_col.popover("✏️ Edit Bill Anyway", use_container_width=True):
+            st.caption("Only if you are sure the sale was not recorded (check the Insights sales log). Otherwise it may be billed twice.")
+            if st.button("Unlock Bill", use_container_width=True):
+                st.session_state.pending_sale = None
                 st.rerun()
-            except Exception as e:
-                st.error(f"Transaction failed: {e}")
+    elif st.session_state.last_sale is None:
+        if st.button("🚀 FINALIZE TRANSACTION & PRINT", type="primary", disabled=not bill_rows or incomplete_count > 0):
+            db_sale_items, pdf_sale_items = [], []
+            for row, line in zip(bill_rows, bill_lines.itertuples(index=False)):
+                db_sale_items.append({
+                    "product_id": row['id'], "quantity": row['quantity'], "price_at_sale": float(row['price']),
+                    "hsn_code": row['hsn_code'], "gst_rate": row['gst_rate'], "discount_percent": float(row['discount']),
+                    "taxable_value": rupees(line.taxable), "cgst_amount": rupees(line.cgst), "sgst_amount": rupees(line.sgst),
+                })
+                pdf_sale_items.append({"name": row['name'], "quantity": row['quantity'], "price": float(row['price'])})
+            record_sale({
+                "phone": cust_phone, "total": total_bill, "payment_mode": payment_mode,
+                "db_items": db_sale_items, "pdf_items": pdf_sale_items, "tax": tax,
+                "tax_summary": {k: v for k, v in tax.items() if k != 'hsn'},
+                "lines": [{k: row[k] for k in ('name', 'quantity', 'price', 'discount')} for row in bill_rows],
+            })
     
     # --- UPDATED CHECKOUT LOGIC WITH DYNAMIC WHATSAPP ---
     if st.session_state.last_sale:
         ls = st.session_state.last_sale
         st.success(f"Sale Recorded Successfully. ID: {ls['id'][:8]}")
         
-        pdf_buffer = generate_invoice_pdf(ls['id'], ls['items'], ls['total'], ls['phone'], payment_mode)
+        pdf_buffer = generate_invoice_pdf(ls['id'], ls['items'], ls['total'], ls['phone'], payment_mode, ls['tax'])
         
         c1, c2, c3 = st.columns(3)
         with c1: 
@@ -1,10 +1,17 @@
 import streamlit as st
 import pandas as pd
-from src.database import supabase
+from src.db_client import run
+from src.forecast import build_reorder_forecast
+from src.database import supabase, BRANCH_ID, set_min_stock_levels, fetch_low_stock_products, search_customers, fetch_customer_history
+from src.exports import SALES_LEDGER_COLUMNS, iter_sales_ledger, build_export
+from src.analytics import BUCKETS, DEFAULT_RANGE_DAYS, fetch_sales_series, fetch_top_products, clear_analytics_cache, day_bounds, shop_today
+from src.jobs import start_background_jobs
+from src.utils import get_invoice_pdf
 import datetime
 
 # --- 1. PAGE CONFIG & HIDE SIDEBAR ---
 st.set_page_config(page_title="Haveli Insights", layout="wide", initial_sidebar_state="collapsed")
+start_background_jobs()  # once per server process; later calls are no-ops
 
 # --- 2. THEME & PERSISTENT NAVIGATION CSS ---
 st.markdown("""
@@ -79,6 +86,7 @@ st.divider()
 with st.sidebar:
     st.markdown("### 🏮 Admin Panel")
     st.write(f"User: **{st.secrets['ADMIN_USER']}**")
+    st.write(f"Branch: **#{BRANCH_ID}**")
     if st.button("🚪 Logout", use_container_width=True):
         st.session_state.logged_in = False
         st.switch_page("app.py")
@@ -89,89 +97,214 @@ with st.sidebar:
 st.title("📊 Business Analytics")
 st.write("Track your sales performance and inventory health at a glance.")
 
+# --- RANGE SELECTOR ---
+today = shop_today()
+yesterday = today - datetime.timedelta(days=1)
+
+f_col1, f_col2, f_col3 = st.columns([2, 1, 1], vertical_alignment="bottom")
+date_range = f_col1.date_input("📅 Date Range", value=(today - datetime.timedelta(days=DEFAULT_RANGE_DAYS - 1), today), max_value=today)
+bucket = f_col2.selectbox("Group By", BUCKETS, format_func=str.title)
+if f_col3.button("🔄 Refresh Data", use_container_width=True):
+    clear_analytics_cache()
+
+# The picker returns a single date while the user is still choosing the end of the range
+start_date, end_date = (date_range[0], date_range[-1]) if date_range else (today, today)
+
+# The sales log is paged server-side; a new range starts again from its newest page
+LOG_PAGE_SIZE = 50
+if st.session_state.get('log_range') != (start_date, end_date):
+    st.session_state.log_range = (start_date, end_date)
+    st.session_state.log_page = 0
+
 with st.spinner("Analyzing shop data..."):
     try:
-        sales_res = supabase.table("sales").select("*").order("created_at", desc=True).execute()
-        items_res = supabase.table("sale_items").select(
-            "*, sales(created_at), products(name, cost_price)"
-        ).execute()
-        products_res = supabase.table("products").select("name, current_stock, min_stock_level").execute()
+        series = fetch_sales_series(start_date, end_date, bucket)
+        recent = {row['period']: row['revenue'] for row in fetch_sales_series(yesterday, today, "day")}
+        top_products = fetch_top_products(start_date, end_date)
+        low_stock = fetch_low_stock_products()
+        range_start, range_end = day_bounds(start_date, end_date)
+        log_offset = st.session_state.log_page * LOG_PAGE_SIZE
+        sales_res = run(supabase.table("sales").select("*", count="exact").eq("branch_id", BRANCH_ID)
+            .gte("created_at", range_start).lt("created_at", range_end)
+            .order("created_at", desc=True).order("id", desc=True)
+            .range(log_offset, log_offset + LOG_PAGE_SIZE - 1))
     except Exception as e:
         st.error(f"Error fetching data: {e}")
-        sales_res, items_res, products_res = None, None, None
+        series, recent, top_products, low_stock, sales_res = [], {}, [], [], None
 
-if sales_res and sales_res.data:
-    df_sales = pd.DataFrame(sales_res.data)
-    df_items = pd.DataFrame(items_res.data)
-    
-    if not df_items.empty:
-        df_items['product_name'] = df_items['products'].apply(lambda x: x['name'] if x else "Unknown")
-        df_items['cost_price'] = df_items['products'].apply(lambda x: float(x['cost_price']) if x else 0.0)
-        df_items['created_at'] = df_items['sales'].apply(lambda x: x['created_at'] if x else None)
-        df_items['date'] = pd.to_datetime(df_items['created_at']).dt.date
-        
-        df_items['total_cost'] = df_items['cost_price'] * df_items['quantity']
-        df_items['total_revenue'] = df_items['price_at_sale'] * df_items['quantity']
-        df_items['profit'] = df_items['total_revenue'] - df_items['total_cost']
-
-    # --- TOP ROW: KPI Metrics ---
-    today = datetime.date.today()
-    yesterday = today - datetime.timedelta(days=1)
-
-    today_sales = df_items[df_items['date'] == today]['total_revenue'].sum() if not df_items.empty else 0
-    yesterday_sales = df_items[df_items['date'] == yesterday]['total_revenue'].sum() if not df_items.empty else 0
-    total_rev = df_items['total_revenue'].sum() if not df_items.empty else 0
-    total_prof = df_items['profit'].sum() if not df_items.empty else 0
-
-    with st.container(border=True):
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Today's Revenue", f"₹{today_sales:,.2f}", 
-                    delta=f"₹{today_sales - yesterday_sales:,.2f}")
-        col2.metric("Total Net Profit", f"₹{total_prof:,.2f}")
-        col3.metric("Lifetime Revenue", f"₹{total_rev:,.2f}")
+df_series = pd.DataFrame(series, columns=['period', 'revenue', 'profit', 'units'])
 
-    st.divider()
+# --- TOP ROW: KPI Metrics ---
+today_sales = float(recent.get(today.isoformat(), 0) or 0)
+yesterday_sales = float(recent.get(yesterday.isoformat(), 0) or 0)
 
-    # --- MIDDLE ROW: Visuals ---
-    col_left, col_right = st.columns([2, 1])
+with st.container(border=True):
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Today's Revenue", f"₹{today_sales:,.2f}",
+                delta=f"₹{today_sales - yesterday_sales:,.2f}")
+    col2.metric("Revenue (Range)", f"₹{df_series['revenue'].astype(float).sum():,.2f}")
+    col3.metric("Net Profit (Range)", f"₹{df_series['profit'].astype(float).sum():,.2f}")
+    col4.metric("Units Sold (Range)", f"{int(df_series['units'].sum()):,}")
 
-    with col_left:
-        st.subheader("🔥 Popular Products")
-        if not df_items.empty:
-            top_prods = df_items.groupby('product_name')['quantity'].sum().sort_values(ascending=False).head(8)
-            st.bar_chart(top_prods, color="#ff5252") 
-        else:
-            st.info("No sales recorded yet.")
-
-    with col_right:
-        st.subheader("⚠️ Stock Alerts")
-        if products_res and products_res.data:
-            df_p = pd.DataFrame(products_res.data)
-            low_stock_df = df_p[df_p['current_stock'] <= df_p['min_stock_level']]
-            
-            if not low_stock_df.empty:
-                st.warning(f"{len(low_stock_df)} items need reordering!")
-                st.dataframe(
-                    low_stock_df[['name', 'current_stock']].sort_values('current_stock'), 
-                    use_container_width=True, hide_index=True
-                )
-            else:
-                st.success("All stock levels are healthy!")
-
-    # --- BOTTOM SECTION: Detailed Log ---
-    st.divider()
-    st.subheader("📜 Detailed Sales Log")
-    search_term = st.text_input("🔍 Filter by Customer Number", placeholder="Type phone number...")
-    
-    display_history = df_sales.copy()
-    if search_term:
-        display_history = display_history[display_history['customer_phone'].str.contains(search_term, na=False)]
+st.divider()
+
+# --- TREND ROW: Bucketed Series ---
+st.subheader({"day": "📈 Daily Trend", "week": "📈 Weekly Trend", "month": "📈 Monthly Trend"}[bucket])
+if not df_series.empty:
+    df_series['period'] = pd.to_datetime(df_series['period'])
+    df_series = df_series.set_index('period').astype(float)
+    trend_col, units_col = st.columns([2, 1])
+    trend_col.line_chart(df_series[['revenue', 'profit']], color=["#ff5252", "#00c853"])
+    units_col.bar_chart(df_series['units'], color="#ff5252")
+else:
+    st.info("No sales in this period.")
+
+st.divider()
+
+# --- MIDDLE ROW: Visuals ---
+col_left, col_right = st.columns([2, 1])
 
-    if not display_history.empty:
-        display_history['Date & Time'] = pd.to_datetime(display_history['created_at']).dt.strftime('%d %b, %I:%M %p')
-        display_history['Amount'] = display_history['total_amount'].apply(lambda x: f"₹{x:,.2f}")
-        history_view = display_history.rename(columns={'customer_phone': 'Customer', 'payment_mode': 'Method'})[['Date & Time', 'Customer', 'Amount', 'Method']]
-        st.dataframe(history_view, use_container_width=True, hide_index=True)
+with col_left:
+    st.subheader("🔥 Popular Products")
+    if top_products:
+        top_prods = pd.DataFrame(top_products).set_index('product_name')['units']
+        st.bar_chart(top_prods, color="#ff5252")
+    else:
+        st.info("No sales recorded yet.")
 
+with col_right:
+    st.subheader("⚠️ Stock Alerts")
+    if low_stock:
+        st.warning(f"{len(low_stock)} items need reordering!")
+        st.dataframe(
+            pd.DataFrame(low_stock)[['name', 'current_stock']],
+            use_container_width=True, hide_index=True
+        )
+    else:
+        st.success("All stock levels are healthy!")
+
+# --- BOTTOM SECTION: Detailed Log ---
+st.divider()
+st.subheader("📜 Detailed Sales Log")
+search_term = st.text_input("🔍 Filter by Customer Number", placeholder="Type phone number...")
+
+def show_sales_log(rows):
+    history = pd.DataFrame(rows)
+    history['Date & Time'] = pd.to_datetime(history['created_at']).dt.strftime('%d %b, %I:%M %p')
+    history['Amount'] = history['total_amount'].apply(lambda x: f"₹{x:,.2f}")
+    history_view = history.rename(columns={'customer_phone': 'Customer', 'payment_mode': 'Method'})[['Date & Time', 'Customer', 'Amount', 'Method']]
+    st.dataframe(history_view, use_container_width=True, hide_index=True)
+
+    # Today's invoices are pre-rendered by the background jobs; older ones render on demand
+    labels = dict(zip(history['id'], history['Date & Time'] + " · " + history['Amount']))
+    sale_id = st.selectbox(
+        "🧾 Reprint Invoice", [None] + list(labels),
+        format_func=lambda i: "Select a sale..." if i is None else f"{labels[i]} · {i[:8]}",
+    )
+    if sale_id:
+        pdf = get_invoice_pdf(sale_id)
+        if pdf:
+            st.download_button("📥 Download Invoice", data=pdf, file_name=f"Haveli_{sale_id[:8]}.pdf", mime="application/pdf")
+        else:
+            st.warning("This sale no longer exists (it may have been voided).")
+
+if search_term:
+    # Prefix lookup on the customer directory instead of scanning every sale
+    matches = search_customers(search_term, limit=20)
+    if matches:
+        customer = st.selectbox(
+            "Customer", matches,
+            format_func=lambda c: f"{c['phone']} · {c['visit_count']} visits · ₹{float(c['lifetime_spend']):,.2f}",
+        )
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Visits", customer['visit_count'])
+        c2.metric("Lifetime Spend", f"₹{float(customer['lifetime_spend']):,.2f}")
+        c3.metric("Last Purchase", pd.to_datetime(customer['last_purchase_at']).strftime('%d %b %Y') if customer['last_purchase_at'] else "-")
+        history = fetch_customer_history(customer['phone'])
+        if history:
+            show_sales_log(history)
+    else:
+        st.info("No customer found with that number.")
+elif sales_res and sales_res.data:
+    show_sales_log(sales_res.data)
+    log_pages = max(1, -(-(sales_res.count or 0) // LOG_PAGE_SIZE))
+    l_prev, l_info, l_next = st.columns([1, 2, 1], vertical_alignment="center")
+    if l_prev.button("⬅️ Newer", use_container_width=True, disabled=st.session_state.log_page == 0):
+        st.session_state.log_page -= 1
+        st.rerun()
+    l_info.markdown(
+        f"<p style='text-align: center;'>Page {st.session_state.log_page + 1} of {log_pages} · {sales_res.count or 0:,} sales</p>",
+        unsafe_allow_html=True)
+    if l_next.button("Older ➡️", use_container_width=True, disabled=st.session_state.log_page + 1 >= log_pages):
+        st.session_state.log_page += 1
+        st.rerun()
+elif sales_res and st.session_state.log_page > 0:
+    # The range shrank under this page (e.g. after a void); step back to its last page
+    st.session_state.log_page = max(0, -(-(sales_res.count or 0) // LOG_PAGE_SIZE) - 1)
+    st.rerun()
 else:
-    st.info("No records found yet.")
\ No newline at end of file
+    st.info("No records found yet.")
+
+st.divider()
+
+# --- REORDER FORECAST ---
+st.subheader("🔮 Reorder Forecast")
+st.caption("Demand is an exponentially weighted average of daily sales over the last two years.")
+if st.button("📈 Run Forecast"):
+    with st.spinner("Forecasting demand..."):
+        try:
+            st.session_state.reorder_forecast = build_reorder_forecast()
+        except Exception as e:
+            st.error(f"Forecast failed: {e}")
+
+if 'reorder_forecast' in st.session_state:
+    forecast = st.session_state.reorder_forecast
+    to_reorder = forecast[forecast['reorder_qty'] > 0]
+    if not to_reorder.empty:
+        st.warning(f"{len(to_reorder)} items should be reordered.")
+    else:
+        st.success("No reorders needed.")
+    st.dataframe(
+        forecast[['name', 'current_stock', 'velocity', 'ewma_demand', 'days_of_cover', 'min_stock_level', 'suggested_alert_level', 'reorder_qty']],
+        column_config={
+            "name": "Product Name",
+            "current_stock": st.column_config.NumberColumn("In Stock", format="%d"),
+            "velocity": st.column_config.NumberColumn("Units/Day (30d)", format="%.2f"),
+            "ewma_demand": st.column_config.NumberColumn("Forecast/Day", format="%.2f"),
+            "days_of_cover": st.column_config.NumberColumn("Days of Cover", format="%.1f"),
+            "min_stock_level": "Alert Level",
+            "suggested_alert_level": "Suggested Alert",
+            "reorder_qty": "Reorder Qty",
+        },
+        use_container_width=True, hide_index=True
+    )
+    changed = forecast[forecast['suggested_alert_level'] != forecast['min_stock_level']]
+    if not changed.empty and st.button(f"✅ Apply {len(changed)} Suggested Alert Levels"):
+        try:
+            set_min_stock_levels(dict(zip(changed['id'], changed['suggested_alert_level'])))
+            del st.session_state.reorder_forecast
+            st.toast("Alert levels updated!")
+            st.rerun()
+        except Exception as e:
+            st.error(f"Failed to update: {e}")
+
+st.divider()
+
+# --- EXPORT SECTION ---
+st.subheader("📤 Export Sales Ledger")
+st.caption(f"Every sale line from {start_date:%d %b %Y} to {end_date:%d %b %Y}, written page by page.")
+exp_col1, exp_col2, exp_col3 = st.columns(3, vertical_alignment="bottom")
+export_fmt = exp_col1.radio("Format", ["xlsx", "csv"], format_func=lambda f: "Excel" if f == "xlsx" else "CSV", horizontal=True)
+if exp_col2.button("⚙️ Prepare Export", use_container_width=True):
+    with st.spinner("Writing ledger..."):
+        try:
+            range_start, range_end = day_bounds(start_date, end_date)
+            export_file, mime = build_export(iter_sales_ledger(range_start, range_end), SALES_LEDGER_COLUMNS, export_fmt, "Sales")
+            st.session_state.sales_export = (export_file, mime, f"Haveli_Sales_{start_date}_{end_date}.{export_fmt}")
+        except Exception as e:
+            st.error(f"Export failed: {e}")
+
+if 'sales_export' in st.session_state:
+    export_file, mime, file_name = st.session_state.sales_export
+    export_file.seek(0)
+    exp_col3.download_button("📥 Download", data=export_file, file_name=file_name, mime=mime, use_container_width=True)
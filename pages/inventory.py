@@ -1,9 +1,14 @@
 import streamlit as st
 import pandas as pd
-from src.database import fetch_all_products, bulk_upload_products, supabase
+import time
+import uuid
+from src.database import BRANCH_ID, GRID_COLUMNS, GRID_SORTS, get_catalog, fetch_product_page, fetch_categories, bulk_upload_products, save_grid_edits, fetch_branches, transfer_stock
+from src.exports import INVENTORY_COLUMNS, iter_inventory, build_export
+from src.jobs import start_background_jobs
 
 # --- 1. PAGE CONFIG & HIDE DEFAULTS ---
 st.set_page_config(page_title="Haveli Inventory", layout="wide", initial_sidebar_state="collapsed")
+start_background_jobs()  # once per server process; later calls are no-ops
 
 # --- 2. THEME & PERSISTENT NAVIGATION CSS ---
 st.markdown("""
@@ -75,6 +80,7 @@ st.divider()
 with st.sidebar:
     st.markdown("### 🏮 Admin Panel")
     st.write(f"User: **{st.secrets['ADMIN_USER']}**")
+    st.write(f"Branch: **#{BRANCH_ID}**")
     if st.button("🚪 Logout", use_container_width=True):
         st.session_state.logged_in = False
         st.switch_page("app.py")
@@ -83,75 +89,161 @@ with st.sidebar:
 
 # --- 6. INVENTORY LOGIC ---
 st.title("📦 Inventory Control Center")
-tab_manage, tab_import = st.tabs(["📋 Manage Stock", "📥 Bulk Import"])
+tab_manage, tab_import, tab_transfer, tab_export = st.tabs(["📋 Manage Stock", "📥 Bulk Import", "🔁 Transfer", "📤 Export"])
 
 # --- TAB 1: MANAGE STOCK ---
+# Only the visible page is fetched (filtered, sorted and paged in Postgres). Unsaved edits
+# are kept per product id, so they survive paging, filtering and sorting until saved.
+EDITABLE_COLS = ['sku', 'barcode', 'hsn_code', 'gst_rate', 'current_stock', 'selling_price', 'min_stock_level']
+SORT_LABELS = {"name": "Name", "category": "Category", "sku": "SKU", "current_stock": "Stock", "selling_price": "Price"}
+WINDOW_TTL = 60  # seconds before the visible page is re-read, so stock sold elsewhere shows up
+
+if 'inv_edits' not in st.session_state: st.session_state.inv_edits = {}   # product id -> {column: value}
+if 'inv_page' not in st.session_state: st.session_state.inv_page = 0
+if 'inv_window' not in st.session_state: st.session_state.inv_window = None  # the fetched page
+if 'inv_window_id' not in st.session_state: st.session_state.inv_window_id = 0
+
+def _py(value):
+    """Grid cell to a JSON-ready value."""
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+def reload_inventory_window():
+    st.session_state.inv_window = None
+
 with tab_manage:
     with st.container():
         st.subheader("Live Inventory View")
-        products = fetch_all_products()
-        
-        if products:
-            # We fetch products fresh but keep the editor state persistent
-            df = pd.DataFrame(products)
-            search_query = st.text_input("🔍 Search by Product Name", placeholder="e.g. Anchor, Wire, Fan")
-            
-            # Apply search filter
-            filtered_df = df.copy()
-            if search_query:
-                filtered_df = df[df['name'].str.contains(search_query, case=False)]
-
-            display_cols = ['name', 'category', 'current_stock', 'selling_price', 'min_stock_level', 'id']
-            
+
+        f_name, f_cat, f_sort, f_dir, f_size, f_refresh = st.columns([3, 2, 1.5, 1, 1, 1], vertical_alignment="bottom")
+        search_query = f_name.text_input("🔍 Search by Product Name", placeholder="e.g. Anchor, Wire, Fan")
+        try:
+            categories = fetch_categories()
+        except Exception:
+            categories = []
+        category = f_cat.selectbox("Category", ["All"] + categories)
+        sort = f_sort.selectbox("Sort By", GRID_SORTS, format_func=SORT_LABELS.get)
+        descending = f_dir.toggle("Desc")
+        page_size = f_size.selectbox("Rows", [25, 50, 100], index=1)
+        if f_refresh.button("🔄 Refresh", use_container_width=True):
+            reload_inventory_window()
+
+        # A new filter or sort starts again from the first page
+        query = (search_query.strip(), category, sort, descending, page_size)
+        if st.session_state.get('inv_query') != query:
+            st.session_state.inv_query = query
+            st.session_state.inv_page = 0
+
+        # Reruns on the same page reuse the fetched window for up to WINDOW_TTL seconds. Edits
+        # are keyed by product id, so a re-read that reorders rows cannot misplace them.
+        window_key = (query, st.session_state.inv_page)
+        window = st.session_state.inv_window
+        if window is None or window['key'] != window_key or time.monotonic() - window.get('fetched_at', 0) > WINDOW_TTL:
+            try:
+                rows, total = fetch_product_page(
+                    st.session_state.inv_page, page_size, search_query,
+                    None if category == "All" else category, sort, descending,
+                )
+            except Exception as e:
+                st.error(f"Error loading inventory: {e}")
+                rows, total = [], 0
+            st.session_state.inv_window_id += 1
+            window = st.session_state.inv_window = {
+                "key": window_key, "id": st.session_state.inv_window_id, "total": total, "fetched_at": time.monotonic(),
+                "rows": pd.DataFrame(rows, columns=GRID_COLUMNS).set_index('id'),
+            }
+
+        page_df = window['rows']
+        pages = max(1, -(-window['total'] // page_size))
+        if page_df.empty and st.session_state.inv_page > 0:
+            # The filtered set shrank (e.g. after a save); step back to its last page
+            st.session_state.inv_page = pages - 1
+            st.rerun()
+        if not page_df.empty:
+            # Show pending edits made on this page earlier (before paging away)
+            grid_df = page_df.copy()
+            for product_id in grid_df.index.intersection(list(st.session_state.inv_edits)):
+                for col, value in st.session_state.inv_edits[product_id].items():
+                    grid_df.at[product_id, col] = value
+
             # --- THE GRID EDITOR ---
-            # Removing the form wrapper allows the key="inventory_editor" to update instantly
+            # Rows are indexed by product id, so edits are read back by id rather than by position
             edited_data = st.data_editor(
-                filtered_df[display_cols],
+                grid_df,
                 column_config={
                     "name": st.column_config.TextColumn("Product Name", disabled=True),
                     "category": st.column_config.TextColumn("Category", disabled=True),
+                    "sku": st.column_config.TextColumn("SKU"),
+                    "barcode": st.column_config.TextColumn("Barcode"),
+                    "hsn_code": st.column_config.TextColumn("HSN"),
+                    "gst_rate": st.column_config.NumberColumn("GST %", min_value=0, max_value=28),
                     "current_stock": st.column_config.NumberColumn("In Stock (Qty)"),
                     "selling_price": st.column_config.NumberColumn("Price (Rs.)"),
                     "min_stock_level": st.column_config.NumberColumn("Alert Level"),
-                    "id": None # Hide ID but keep it available for processing
                 },
                 use_container_width=True,
                 hide_index=True,
-                key="inventory_editor"
+                key=f"inventory_editor_{window['id']}"
             )
 
-            # --- DYNAMIC NOTIFICATION LOGIC ---
-            edits = st.session_state.inventory_editor.get("edited_rows", {})
-            
-            # Use columns to align warning and button without creating empty boxes
-            col_warn, col_save = st.columns([2, 1])
-            
-            with col_warn:
-                if edits:
-                    st.markdown(f"<p style='color: #FF5252; font-weight: bold; font-size: 16px;'>⚠️ Warning: You have {len(edits)} unsaved row(s). Click Save to sync!</p>", unsafe_allow_html=True)
+            # Fold this page's cells into the id-keyed edit set
+            for product_id, row in edited_data[EDITABLE_COLS].iterrows():
+                original = page_df.loc[product_id, EDITABLE_COLS]
+                changes = {
+                    col: _py(row[col]) for col in EDITABLE_COLS
+                    if not (pd.isna(row[col]) and pd.isna(original[col])) and row[col] != original[col]
+                }
+                if changes:
+                    st.session_state.inv_edits[product_id] = changes
                 else:
-                    st.markdown("<p style='color: #00FF00; font-size: 16px;'>✅ All data synced.</p>", unsafe_allow_html=True)
-
-            with col_save:
-                if st.button("💾 Save All Changes", use_container_width=True):
-                    if edits:
-                        with st.spinner("Saving..."):
-                            try:
-                                for index_str, changes in edits.items():
-                                    index = int(index_str)
-                                    # We use the filtered_df to find the correct database ID
-                                    product_id = filtered_df.iloc[index]['id']
-                                    supabase.table("products").update(changes).eq("id", product_id).execute()
-                                
-                                st.toast("🚀✅ All changes saved to database!")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Failed to update: {e}")
-                    else:
-                        st.warning("No changes detected.")
+                    st.session_state.inv_edits.pop(product_id, None)
+
+            # --- PAGER ---
+            p_prev, p_info, p_next = st.columns([1, 2, 1], vertical_alignment="center")
+            if p_prev.button("⬅️ Previous", use_container_width=True, disabled=st.session_state.inv_page == 0):
+                st.session_state.inv_page -= 1
+                st.rerun()
+            p_info.markdown(
+                f"<p style='text-align: center;'>Page {st.session_state.inv_page + 1} of {pages} · {window['total']:,} products</p>",
+                unsafe_allow_html=True)
+            if p_next.button("Next ➡️", use_container_width=True, disabled=st.session_state.inv_page + 1 >= pages):
+                st.session_state.inv_page += 1
+                st.rerun()
+        elif search_query or category != "All":
+            st.info("No products match these filters.")
         else:
             st.warning("Inventory is empty.")
 
+        # --- DYNAMIC NOTIFICATION LOGIC ---
+        edits = st.session_state.inv_edits
+
+        # Use columns to align warning and button without creating empty boxes
+        col_warn, col_save = st.columns([2, 1])
+
+        with col_warn:
+            if edits:
+                st.markdown(f"<p style='color: #FF5252; font-weight: bold; font-size: 16px;'>⚠️ Warning: You have {len(edits)} unsaved row(s). Click Save to sync!</p>", unsafe_allow_html=True)
+            else:
+                st.markdown("<p style='color: #00FF00; font-size: 16px;'>✅ All data synced.</p>", unsafe_allow_html=True)
+
+        with col_save:
+            if st.button("💾 Save All Changes", use_container_width=True):
+                if edits:
+                    with st.spinner("Saving..."):
+                        try:
+                            save_grid_edits(edits)
+                            edits.clear()
+
+                            reload_inventory_window()
+                            st.toast("🚀✅ All changes saved to database!")
+                            st.rerun()
+                        except Exception as e:
+                            reload_inventory_window()
+                            st.error(f"Failed to update: {e}")
+                else:
+                    st.warning("No changes detected.")
+
 # --- TAB 2: BULK IMPORT ---
 with tab_import:
     with st.container():
@@ -189,4 +281,64 @@ with tab_import:
                                 st.rerun()
                             
             except Exception as e:
-                st.error(f"Error reading file: {e}")
\ No newline at end of file
+                st.error(f"Error reading file: {e}")
+
+# --- TAB 3: BRANCH TRANSFER ---
+with tab_transfer:
+    with st.container():
+        st.subheader("Transfer Stock to Another Branch")
+        other_branches = [b for b in fetch_branches() if b['id'] != BRANCH_ID]
+
+        if not other_branches:
+            st.info("No other branches set up yet.")
+        else:
+            to_branch = st.selectbox("Destination Branch", other_branches, format_func=lambda b: b['name'])
+            in_stock = {p['name']: p for p in get_catalog() if p['current_stock'] > 0}
+            picked = st.multiselect("Products to Send", list(in_stock))
+
+            if picked:
+                transfer_df = st.data_editor(
+                    pd.DataFrame({
+                        "name": picked,
+                        "available": [in_stock[n]['current_stock'] for n in picked],
+                        "quantity": [1] * len(picked),
+                    }),
+                    column_config={
+                        "name": st.column_config.TextColumn("Product Name", disabled=True),
+                        "available": st.column_config.NumberColumn("Here", disabled=True),
+                        "quantity": st.column_config.NumberColumn("Send Qty", min_value=1, step=1),
+                    },
+                    use_container_width=True, hide_index=True, key="transfer_editor"
+                )
+                col_spacer, col_action = st.columns([2, 1])
+                with col_action:
+                    if st.button("🔁 Transfer Stock", use_container_width=True):
+                        items = [{"product_id": in_stock[row['name']]['id'], "quantity": int(row['quantity'])}
+                                 for _, row in transfer_df.iterrows()]
+                        try:
+                            transfer_stock(to_branch['id'], items, st.session_state.setdefault('transfer_key', str(uuid.uuid4())))
+                            del st.session_state.transfer_key
+                            st.toast(f"✅ Stock sent to {to_branch['name']}!")
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"Transfer failed: {e}")
+
+# --- TAB 4: EXPORT ---
+with tab_export:
+    with st.container():
+        st.subheader("Export Inventory to Excel or CSV")
+        export_fmt = st.radio("Format", ["xlsx", "csv"], format_func=lambda f: "Excel" if f == "xlsx" else "CSV", horizontal=True)
+        col_prep, col_dl = st.columns(2)
+        with col_prep:
+            if st.button("⚙️ Prepare Export", use_container_width=True):
+                with st.spinner("Writing inventory..."):
+                    try:
+                        export_file, mime = build_export(iter_inventory(), INVENTORY_COLUMNS, export_fmt, "Inventory")
+                        st.session_state.inventory_export = (export_file, mime, f"Haveli_Inventory.{export_fmt}")
+                    except Exception as e:
+                        st.error(f"Export failed: {e}")
+        with col_dl:
+            if 'inventory_export' in st.session_state:
+                export_file, mime, file_name = st.session_state.inventory_export
+                export_file.seek(0)
+                st.download_button("📥 Download", data=export_file, file_name=file_name, mime=mime, use_container_width=True)
@@ -1,8 +1,13 @@
 import streamlit as st
-from src.database import fetch_shop_settings, update_shop_settings
+import pandas as pd
+from src.database import BRANCH_ID, fetch_shop_settings, update_shop_settings, take_stock_snapshot, compact_stock_ledger
+from src.jobs import start_background_jobs
+from src.scheduler import scheduler
+from src.utils import clear_invoice_cache
 
 # --- 1. PAGE CONFIG & HIDE DEFAULTS ---
 st.set_page_config(page_title="Haveli Settings", layout="wide", initial_sidebar_state="collapsed")
+start_background_jobs()  # once per server process; later calls are no-ops
 
 # --- 2. THEME & PERSISTENT NAVIGATION CSS ---
 st.markdown("""
@@ -97,6 +102,7 @@ st.divider()
 with st.sidebar:
     st.markdown("### 🏮 Admin Panel")
     st.write(f"User: **{st.secrets['ADMIN_USER']}**")
+    st.write(f"Branch: **#{BRANCH_ID}**")
     if st.button("🚪 Logout", use_container_width=True):
         st.session_state.logged_in = False
         st.switch_page("app.py")
@@ -126,7 +132,10 @@ with st.form("shop_settings_form"):
     with col2:
         st.markdown("### 💳 Payments & Tax")
         new_upi = st.text_input("UPI ID", value=settings.get('upi_id', ''), placeholder="shop@upi")
-        new_tax = st.number_input("Tax / GST %", value=float(settings.get('tax_percent', 0)), min_value=0.0, max_value=28.0)
+        new_tax = st.number_input("Tax / GST %", value=float(settings.get('tax_percent') or 0), min_value=0.0, max_value=28.0,
+                                  help="Default rate for products without their own GST rate.")
+        new_gstin = st.text_input("GSTIN", value=settings.get('gstin') or '', placeholder="24ABCDE1234F1Z5")
+        new_inclusive = st.toggle("Selling prices include GST", value=settings.get('prices_include_tax', True) is not False)
         
         st.write("") # Spacer
         st.info("💡 Changes update your PDF invoices and WhatsApp receipts instantly.")
@@ -140,13 +149,55 @@ with st.form("shop_settings_form"):
                 "shop_address": new_address,
                 "shop_contact": new_contact,
                 "upi_id": new_upi,
-                "tax_percent": new_tax
+                "tax_percent": new_tax,
+                "gstin": new_gstin.strip().upper(),
+                "prices_include_tax": new_inclusive
             }
             try:
                 update_shop_settings(update_data)
+                clear_invoice_cache()  # rendered invoices carry the old shop profile
                 st.success("Settings Saved!")
                 st.rerun()
             except Exception as e:
                 st.error(f"Error: {e}")
 
+# --- STOCK LEDGER MAINTENANCE ---
+with st.expander("🗄️ Stock Ledger Maintenance"):
+    st.caption("Snapshots current stock and folds old movements into snapshots so point-in-time stock stays fast.")
+    keep_days = st.number_input("Keep detailed movements for (days)", min_value=7, value=90, step=1)
+    if st.button("📸 Snapshot & Compact Ledger", use_container_width=True):
+        try:
+            take_stock_snapshot()
+            removed = compact_stock_ledger(int(keep_days))
+            st.success(f"Snapshot taken. {removed or 0} old movement(s) compacted.")
+        except Exception as e:
+            st.error(f"Error: {e}")
+
+# --- BACKGROUND JOBS ---
+with st.expander("⏱️ Background Jobs"):
+    st.caption(f"Scheduler thread: {'🟢 running' if scheduler.running else '🔴 stopped'}. "
+               "Jobs run one at a time; a job is skipped while its previous run is still going.")
+    jobs_df = pd.DataFrame(scheduler.status())
+    st.dataframe(
+        jobs_df,
+        column_config={
+            "job": "Job", "description": "What it does", "every_min": "Every (min)", "state": "State",
+            "runs": "Runs", "failures": "Failures", "skipped": "Skipped",
+            "last_run": st.column_config.DatetimeColumn("Last Run", format="DD MMM, hh:mm:ss a"),
+            "last_secs": st.column_config.NumberColumn("Last (s)", format="%.2f"),
+            "avg_secs": st.column_config.NumberColumn("Avg (s)", format="%.2f"),
+            "next_in_secs": "Next In (s)", "last_error": "Last Error",
+        },
+        use_container_width=True, hide_index=True
+    )
+    j_col, b_col, r_col = st.columns([2, 1, 1], vertical_alignment="bottom")
+    job_name = j_col.selectbox("Job", list(scheduler.jobs))
+    if b_col.button("▶️ Run Now", use_container_width=True):
+        if scheduler.run_now(job_name):
+            st.success(f"Started '{job_name}'. Refresh to see its timing.")
+        else:
+            st.warning(f"'{job_name}' is already running.")
+    if r_col.button("🔄 Refresh", use_container_width=True):
+        st.rerun()
+
 st.markdown("<p style='text-align: center; color: #666; font-size: 0.8rem; margin-top: 20px;'>Haveli Electricals Management System v1.2</p>", unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import datetime
+import threading
+import time
+from zoneinfo import ZoneInfo
+from src.database import supabase, BRANCH_ID
+from src.db_client import run
+
+# --- Date-Range Analytics ---
+# Range filtering and bucketing run in Postgres (see supabase/migrations); only the
+# bucketed rows come back. Results are cached in-process per (query, range) and
+# scoped to this terminal's branch.
+
+BUCKETS = ("day", "week", "month")
+SHOP_TZ = "Asia/Kolkata"
+CACHE_TTL = 300  # seconds
+DEFAULT_RANGE_DAYS = 30  # the Insights page's initial range, kept warm by the scheduler
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _cached(key, loader, refresh=False):
+    """Returns a cached result for `key`, calling `loader` when missing, stale or `refresh` is set."""
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit and not refresh and now - hit[0] < CACHE_TTL:
+        return hit[1]
+    data = loader()
+    with _cache_lock:
+        _cache[key] = (now, data)
+    return data
+
+def clear_analytics_cache():
+    """Drops every cached series, e.g. after a sale or on manual refresh."""
+    with _cache_lock:
+        _cache.clear()
+
+def fetch_sales_series(start_date, end_date, bucket="day", refresh=False):
+    """Revenue, profit and units per bucket between two dates (inclusive)."""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+    params = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+              "bucket": bucket, "tz": SHOP_TZ, "p_branch": BRANCH_ID}
+    return _cached(("series", start_date, end_date, bucket),
+                   lambda: run(supabase.rpc("sales_series", params)).data, refresh)
+
+def fetch_top_products(start_date, end_date, limit=8, refresh=False):
+    """Best-selling products by units between two dates (inclusive)."""
+    params = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+              "max_rows": limit, "tz": SHOP_TZ, "p_branch": BRANCH_ID}
+    return _cached(("top", start_date, end_date, limit),
+                   lambda: run(supabase.rpc("top_products", params)).data, refresh)
+
+def warm_analytics_cache():
+    """Recomputes the Insights page's default views and drops expired entries."""
+    today = shop_today()
+    start = today - datetime.timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    fetch_sales_series(start, today, "day", refresh=True)
+    fetch_sales_series(today - datetime.timedelta(days=1), today, "day", refresh=True)
+    fetch_top_products(start, today, refresh=True)
+
+    cutoff = time.monotonic() - CACHE_TTL
+    with _cache_lock:
+        for key in [k for k, (loaded_at, _) in _cache.items() if loaded_at < cutoff]:
+            del _cache[key]
+
+def day_bounds(start_date, end_date):
+    """ISO timestamps spanning two local shop dates, end exclusive, for direct table filters."""
+    tz = ZoneInfo(SHOP_TZ)
+    start = datetime.datetime.combine(start_date, datetime.time.min, tzinfo=tz)
+    end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz)
+    return start.isoformat(), end.isoformat()
+
+def shop_today():
+    """Today's date in the shop's time zone, matching the buckets above."""
+    return datetime.datetime.now(ZoneInfo(SHOP_TZ)).date()
@@ -0,0 +1,102 @@
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# --- GST Bill Calculation ---
+# Money is converted once, exactly, to integer paise and rates to basis points
+# (18% = 1800). Everything after that is int64 arithmetic over the whole cart, so
+# results are exact and a 500-line bill is a handful of array operations.
+# Tax is charged as equal CGST and SGST halves (intra-state supply).
+
+def _to_units(values, scale):
+    """Decimal-exact conversion of rupees/percentages to integers (paise, basis points)."""
+    return np.array(
+        [int((Decimal(str(v or 0)) * scale).quantize(Decimal(1), rounding=ROUND_HALF_UP)) for v in values],
+        dtype=np.int64,
+    )
+
+def _div_half_up(num, den):
+    """Integer division rounding halves up, for non-negative arrays."""
+    return (2 * num + den) // (2 * den)
+
+def compute_bill(quantities, prices, gst_rates, discounts=None, prices_include_tax=True):
+    """Per-line taxable value, CGST/SGST and totals for a cart, in one vectorized pass.
+
+    `prices` are per-unit rupees, `gst_rates` and `discounts` are percentages. Returns
+    (lines, summary): `lines` is a DataFrame of paise columns in cart order and `summary`
+    is a dict of paise totals including the round-off to the nearest rupee.
+    """
+    qty = np.asarray(quantities, dtype=np.int64)
+    price = _to_units(prices, 100)
+    rate = _to_units(gst_rates, 100)
+    disc = _to_units(discounts if discounts is not None else [0] * len(qty), 100)
+
+    gross = qty * price
+    discount = _div_half_up(gross * disc, 10000)
+    net = gross - discount
+    # CGST and SGST are each charged at half the rate and rounded once, so they always
+    # match. For tax-inclusive prices the taxable value absorbs the rounding, so the line
+    # still totals to the shelf price.
+    if prices_include_tax:
+        cgst = _div_half_up(net * rate, 2 * (10000 + rate))
+        taxable = net - 2 * cgst
+    else:
+        taxable = net
+        cgst = _div_half_up(taxable * rate, 20000)
+    sgst = cgst
+    tax = cgst + sgst
+
+    lines = pd.DataFrame({
+        "gross": gross, "discount": discount, "taxable": taxable,
+        "gst_rate_bp": rate, "cgst": cgst, "sgst": sgst, "line_total": taxable + tax,
+    })
+    total = int(lines['line_total'].sum())
+    rounded = int(_div_half_up(np.int64(total), np.int64(100))) * 100
+    summary = {
+        "gross": int(gross.sum()), "discount": int(discount.sum()), "taxable": int(taxable.sum()),
+        "cgst": int(cgst.sum()), "sgst": int(sgst.sum()),
+        "round_off": rounded - total, "grand_total": rounded,
+    }
+    return lines, summary
+
+def hsn_summary(lines, hsn_codes):
+    """Taxable value and tax grouped by HSN code and rate, as printed on the invoice."""
+    grouped = lines.assign(hsn=[h or "-" for h in hsn_codes]) \
+        .groupby(['hsn', 'gst_rate_bp'], sort=True)[['taxable', 'cgst', 'sgst']].sum().reset_index()
+    return grouped
+
+@lru_cache(maxsize=64)
+def _cached_bill(cart_key, prices_include_tax):
+    names, hsn, qty, price, rate, disc = zip(*cart_key)
+    lines, summary = compute_bill(qty, price, rate, disc, prices_include_tax)
+    return lines, summary, hsn_summary(lines, hsn)
+
+def bill_for_cart(rows, prices_include_tax=True):
+    """Bill for cart rows ({name, hsn_code, quantity, price, gst_rate, discount}).
+
+    Results are cached on the cart's contents, so Streamlit reruns that leave the cart
+    unchanged reuse the previous calculation.
+    """
+    if not rows:
+        return None, None, None
+    cart_key = tuple(
+        (r['name'], r.get('hsn_code') or "", int(r['quantity']), str(r['price']),
+         str(r.get('gst_rate') or 0), str(r.get('discount') or 0))
+        for r in rows
+    )
+    return _cached_bill(cart_key, prices_include_tax)
+
+def rupees(paise):
+    """Paise (int, array or Series) to rupees, for display and storage."""
+    return paise / 100
+
+def tax_summary_rupees(summary, hsn):
+    """Bill totals and HSN rows in rupees, as stored on the sale and printed on the invoice."""
+    totals = {k: rupees(summary[k]) for k in ('discount', 'taxable', 'cgst', 'sgst', 'round_off')}
+    totals['hsn'] = [
+        {"hsn": row.hsn, "rate": row.gst_rate_bp / 100, "taxable": rupees(row.taxable),
+         "cgst": rupees(row.cgst), "sgst": rupees(row.sgst)}
+        for row in hsn.itertuples(index=False)
+    ]
+    return totals
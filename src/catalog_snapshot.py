@@ -0,0 +1,63 @@
+import datetime
+import os
+import threading
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# --- Local Catalog Snapshot ---
+# Each branch's product catalog is persisted as an Arrow IPC file with the sync
+# watermark (the newest synced_at it contains) in the schema metadata. On startup it
+# is read through a memory map and used in place; only rows changed since the
+# watermark are fetched.
+
+SNAPSHOT_DIR = os.environ.get("CATALOG_SNAPSHOT_DIR", ".cache")
+WATERMARK_KEY = b"sync_watermark"
+
+def snapshot_path(branch_id):
+    """Snapshot file for one branch's catalog."""
+    return os.path.join(SNAPSHOT_DIR, f"catalog_branch{branch_id}.arrow")
+
+def newest_watermark(rows, current=None):
+    """Latest synced_at among rows (ISO string), or `current` if none is newer."""
+    newest = datetime.datetime.fromisoformat(current) if current else None
+    for row in rows:
+        if row.get('synced_at'):
+            stamp = datetime.datetime.fromisoformat(row['synced_at'])
+            if newest is None or stamp > newest:
+                newest = stamp
+    return newest.isoformat() if newest else None
+
+def load_snapshot(path):
+    """Returns (table, watermark) from the snapshot file, or (None, None) if there is none.
+
+    The table's buffers point into the memory map, so nothing is copied or converted.
+    """
+    try:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None, None
+    watermark = (table.schema.metadata or {}).get(WATERMARK_KEY)
+    return table, watermark.decode() if watermark else None
+
+def merge_rows(table, rows):
+    """`table` with the rows whose id appears in `rows` replaced by `rows` (either may be empty)."""
+    if not rows:
+        return table
+    patch = pa.Table.from_pylist(rows)
+    if table is None or table.num_rows == 0:
+        return patch
+    kept = table.filter(pc.invert(pc.is_in(table['id'], value_set=patch['id'].cast(table['id'].type))))
+    return pa.concat_tables([kept.replace_schema_metadata(None), patch], promote_options="permissive")
+
+def save_snapshot(table, watermark, path):
+    """Atomically replaces the snapshot file with `table`."""
+    if table is None or table.num_rows == 0 or not watermark:
+        return
+    table = table.replace_schema_metadata({WATERMARK_KEY: watermark.encode()})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # concurrent savers never share a temp file
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
@@ -1,100 +1,496 @@
 import os
-from supabase import create_client, Client
+import json
+import math
+import uuid
+import datetime
+import threading
+import time
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
+import pyarrow as pa
+from src.db_client import run, DB_TIMEOUT
+from src.catalog_snapshot import load_snapshot, save_snapshot, merge_rows, newest_watermark, snapshot_path
 
 # Load credentials from .env
 load_dotenv()
 url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
 
-supabase: Client = create_client(url, key)
+supabase: Client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT))
+
+# Each terminal serves one branch; every stock, settings and sales query below is scoped to it
+BRANCH_ID = int(os.environ.get("BRANCH_ID", 1))
+
+# --- Stock Ledger ---
+# Every stock change is appended to 'stock_movements'; branch_stock.current_stock is the running total.
+
+MOVE_SALE, MOVE_VOID, MOVE_ADJUST, MOVE_IMPORT = "sale", "void", "adjust", "import"
+
+def apply_stock_movements(movements):
+    """Appends a batch of movements and shifts branch stock with them in one round trip."""
+    if not movements:
+        return []
+    movements = [{"branch_id": BRANCH_ID, **m} for m in movements]
+    rows = run(supabase.rpc("apply_stock_movements", {"movements": movements}), idempotent=False).data
+    _sync_products(rows)
+    return rows
+
+def take_stock_snapshot():
+    """Snapshots this branch's stock at the current ledger watermark."""
+    return run(supabase.rpc("take_stock_snapshot", {"p_branch": BRANCH_ID}), idempotent=False).data
+
+def compact_stock_ledger(keep_days=90):
+    """Folds this branch's movements older than `keep_days` into snapshots. Returns rows removed."""
+    return run(supabase.rpc("compact_stock_ledger", {"p_branch": BRANCH_ID, "keep_days": keep_days})).data
+
+def fetch_stock_at(product_id, at):
+    """Stock of a product at a point in time: nearest earlier snapshot plus the movements after it.
+
+    Returns (stock, exact). Once the ledger has been compacted past `at`, only month-end
+    snapshots remain for that period. The result is then the last snapshot before `at`,
+    and `exact` is False.
+    """
+    snap = run(supabase.table("stock_snapshots").select("stock, last_movement_id")
+        .eq("branch_id", BRANCH_ID).eq("product_id", product_id).lte("taken_at", at.isoformat())
+        .order("taken_at", desc=True).limit(1))
+    base, watermark = (snap.data[0]['stock'], snap.data[0]['last_movement_id']) if snap.data else (0, 0)
+
+    tail = run(supabase.table("stock_movements").select("delta")
+        .eq("branch_id", BRANCH_ID).eq("product_id", product_id)
+        .gt("id", watermark).lte("created_at", at.isoformat()))
+
+    compacted = run(supabase.table("stock_ledger_compactions").select("branch_id")
+        .eq("branch_id", BRANCH_ID).gte("compacted_before", at.isoformat()))
+    return base + sum(m['delta'] for m in tail.data), not compacted.data
+
+# --- Low Stock Alerts ---
+# In-process alert set keyed by product id. Seeded once from the 'low_stock_products'
+# view and patched with the returned rows of every stock mutation in this module.
+
+_low_stock = None
+_low_stock_lock = threading.Lock()
+
+def _is_low(row):
+    return row.get('min_stock_level') is not None and row['current_stock'] <= row['min_stock_level']
+
+def _sync_low_stock(rows):
+    """Adds or drops the given product rows from the alert set."""
+    with _low_stock_lock:
+        if _low_stock is None:
+            return  # Not loaded yet; the first read pulls a fresh copy
+        for row in rows:
+            if _is_low(row):
+                _low_stock[row['id']] = {k: row[k] for k in ('id', 'name', 'current_stock', 'min_stock_level')}
+            else:
+                _low_stock.pop(row['id'], None)
+
+def fetch_low_stock_products():
+    """Returns products at or below their alert level, lowest stock first."""
+    global _low_stock
+    with _low_stock_lock:
+        if _low_stock is None:
+            res = run(supabase.table("low_stock_products").select("id, name, current_stock, min_stock_level")
+                .eq("branch_id", BRANCH_ID))
+            _low_stock = {row['id']: row for row in res.data}
+        rows = list(_low_stock.values())
+    return sorted(rows, key=lambda r: r['current_stock'])
+
+def get_low_stock_alert(product_id):
+    """Alert row for a single product, or None when its stock is healthy."""
+    if _low_stock is None:
+        fetch_low_stock_products()
+    return _low_stock.get(product_id)
+
+# --- Product Catalog Index ---
+# In-process copy of the catalog with a hashed SKU/barcode lookup, loaded once per
+# server process and patched with the returned rows of every product write. The local
+# snapshot is used in place as an Arrow table; a snapshot row only becomes a dict when
+# it is first read, and rows fetched or written since the load override it.
+
+_catalog = None         # product id -> row dict (fetched, written, or read from the snapshot)
+_snapshot_rows = None   # Arrow table loaded from the snapshot file
+_snapshot_pos = {}      # product id -> position in _snapshot_rows
+_codes = {}             # normalized SKU/barcode -> product id
+_catalog_lock = threading.Lock()
+# Newest synced_at seen in a delta fetch. Rows patched from this process's own writes
+# never move it, or changes made elsewhere in between would be skipped.
+_sync_watermark = None
+_snapshot_watermark = None  # watermark of the snapshot file on disk
+_delta_rows = {}            # product id -> row from delta fetches, not yet in _snapshot_rows
+SYNC_OVERLAP = datetime.timedelta(minutes=1)
+CATALOG_SNAPSHOT = snapshot_path(BRANCH_ID)
+
+def _code_key(code):
+    return str(code).strip().upper()
+
+def _index_codes(product_id, *codes):
+    for code in codes:
+        if code:
+            _codes[_code_key(code)] = product_id
+
+def _get_row(product_id):
+    """Cached row for a product, materializing it from the snapshot. Caller holds the lock."""
+    row = _catalog.get(product_id)
+    if row is None and product_id in _snapshot_pos:
+        row = _snapshot_rows.slice(_snapshot_pos[product_id], 1).to_pylist()[0]
+        _catalog[product_id] = row
+    return row
+
+def _replace_row(row):
+    """Puts a product row in the index, dropping codes it no longer has. Caller holds the lock."""
+    old = _get_row(row['id'])
+    if old:
+        for field in ('sku', 'barcode'):
+            if old.get(field) and old[field] != row.get(field):
+                _codes.pop(_code_key(old[field]), None)
+    _catalog[row['id']] = row
+    _index_codes(row['id'], row.get('sku'), row.get('barcode'))
+
+def _load_catalog():
+    """Warm-starts the index from the local snapshot plus a delta sync."""
+    global _catalog, _snapshot_rows, _snapshot_pos, _sync_watermark, _snapshot_watermark
+    with _catalog_lock:
+        if _catalog is None:
+            table, watermark = load_snapshot(CATALOG_SNAPSHOT)
+            changed = fetch_products_changed_since(watermark)
+            _snapshot_rows, _snapshot_pos, _catalog = table, {}, {}
+            _codes.clear()
+            if table is not None:
+                # Only the lookup columns are converted; rows stay in the table
+                ids = table['id'].to_pylist()
+                _snapshot_pos = {product_id: pos for pos, product_id in enumerate(ids)}
+                for field in ('sku', 'barcode'):
+                    if field in table.column_names:
+                        for product_id, code in zip(ids, table[field].to_pylist()):
+                            _index_codes(product_id, code)
+            for row in changed:
+                _replace_row(row)
+                _delta_rows[row['id']] = row
+            _snapshot_watermark = watermark
+            _sync_watermark = newest_watermark(changed, watermark)
+
+def _sync_catalog(rows):
+    """Replaces the given product rows in the index."""
+    with _catalog_lock:
+        if _catalog is None:
+            return  # Not loaded yet; the first read pulls a fresh copy
+        for row in rows:
+            _replace_row(row)
+
+def _sync_products(rows):
+    """Pushes freshly written product rows into every in-process cache."""
+    _sync_low_stock(rows)
+    _sync_catalog(rows)
+
+def refresh_catalog():
+    """Pulls rows changed since the last delta fetch (delta sync)."""
+    global _sync_watermark
+    if _catalog is None:
+        return _load_catalog()
+    changed = fetch_products_changed_since(_sync_watermark)
+    _sync_products(changed)
+    with _catalog_lock:
+        _delta_rows.update((row['id'], row) for row in changed)
+        _sync_watermark = newest_watermark(changed, _sync_watermark)
+
+def save_catalog_snapshot():
+    """Writes the snapshot back to disk if a delta fetch brought rows newer than it holds."""
+    global _snapshot_watermark
+    with _catalog_lock:
+        if _catalog is None or _sync_watermark == _snapshot_watermark:
+            return
+        table, rows, watermark = _snapshot_rows, list(_delta_rows.values()), _sync_watermark
+    save_snapshot(merge_rows(table, rows), watermark, CATALOG_SNAPSHOT)
+    with _catalog_lock:
+        _snapshot_watermark = watermark
+
+def get_catalog():
+    """Returns the cached catalog sorted by name, loading it on first use."""
+    _load_catalog()
+    with _catalog_lock:
+        missing = [pos for product_id, pos in _snapshot_pos.items() if product_id not in _catalog]
+        if missing:
+            for row in _snapshot_rows.take(missing).to_pylist():
+                _catalog[row['id']] = row
+        rows = list(_catalog.values())
+    return sorted(rows, key=lambda p: p['name'])
+
+def get_catalog_table(columns):
+    """The cached catalog as an Arrow table of `columns`, without materializing snapshot rows."""
+    _load_catalog()
+    with _catalog_lock:
+        table = _snapshot_rows.select(columns) if _snapshot_rows is not None else None
+        rows = [{c: row.get(c) for c in columns} for row in _catalog.values()]
+    if table is None and not rows:
+        return pa.table({c: [] for c in columns})
+    return merge_rows(table, rows)
+
+def get_product(product_id):
+    """Cached row for one product, or None."""
+    _load_catalog()
+    with _catalog_lock:
+        return _get_row(product_id)
+
+def find_product_by_code(code):
+    """Looks up a product by SKU or barcode. Returns None for unknown codes."""
+    _load_catalog()
+    with _catalog_lock:
+        product_id = _codes.get(_code_key(code))
+        return _get_row(product_id) if product_id is not None else None
 
 # --- Inventory Functions ---
 
-def fetch_all_products():
-    """Returns all products for the inventory list."""
-    response = supabase.table("products").select("*").order("name").execute()
-    return response.data
+def fetch_products_changed_since(watermark=None, page_size=1000):
+    """Products whose catalog entry or branch stock changed after `watermark`, or all when None.
+
+    Pages by keyset on (synced_at, id), and overlaps the watermark slightly so rows
+    committed out of order are not missed; re-applying a row is harmless.
+    """
+    since = None
+    if watermark:
+        since = (datetime.datetime.fromisoformat(watermark) - SYNC_OVERLAP).isoformat()
+    rows, after_ts, after_id = [], None, None
+    while True:
+        page = run(supabase.rpc("branch_products_since", {
+            "p_branch": BRANCH_ID, "since": since,
+            "after_ts": after_ts, "after_id": after_id, "p_limit": page_size,
+        })).data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        after_ts, after_id = page[-1]['synced_at'], page[-1]['id']
+
+STOCK_FIELDS = ('current_stock', 'min_stock_level')
+
+IMPORT_FIELDS = ('name', 'category', 'sku', 'barcode', 'cost_price', 'selling_price',
+                 'hsn_code', 'gst_rate') + STOCK_FIELDS
+
+def _clean_cell(value):
+    """Spreadsheet cell to a JSON-ready value: blanks (NaN) become None, numpy scalars plain Python."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
 
 def bulk_upload_products(data_list):
-    """Expects a list of dictionaries to insert into Supabase."""
-    return supabase.table("products").insert(data_list).execute()
+    """Imports a list of product dictionaries (e.g. spreadsheet rows) in one transaction.
 
-# --- Billing Functions ---
+    Catalog fields go to 'products'; alert levels and opening stock (as 'import'
+    movements) go to this branch. Blank cells are treated as missing.
+    """
+    rows = []
+    for row in data_list:
+        clean = {k: _clean_cell(row.get(k)) for k in IMPORT_FIELDS if k in row}
+        for field in STOCK_FIELDS:
+            if clean.get(field) is not None:
+                clean[field] = int(clean[field])
+        rows.append(clean)
+    result = run(supabase.rpc("import_products", {"p_branch": BRANCH_ID, "p_rows": rows}), idempotent=False).data
+    _sync_products(result)
+    return result
 
-def update_stock_level(product_id, quantity_sold):
-    """Reduces the stock count when a sale is made."""
-    # First, get current stock
-    product = supabase.table("products").select("current_stock").eq("id", product_id).single().execute()
-    new_stock = product.data['current_stock'] - quantity_sold
-    
-    # Update it
-    supabase.table("products").update({"current_stock": new_stock}).eq("id", product_id).execute()
+def save_grid_edits(edits):
+    """Saves {product_id: changes} from the inventory grid.
 
-def create_sale_record(customer_phone, total_amount, payment_mode, items):
+    Stock counts and alert levels are written in one batch each; a changed count is
+    booked as a manual adjustment of the difference. Other fields update 'products'.
     """
-    1. Creates a record in the 'sales' table.
-    2. Uses the resulting Sale ID to create records in 'sale_items'.
+    targets, levels, updated = {}, {}, []
+    for product_id, changes in edits.items():
+        changes = dict(changes)
+        if 'current_stock' in changes:
+            targets[product_id] = changes.pop('current_stock')
+        if 'min_stock_level' in changes:
+            levels[product_id] = changes.pop('min_stock_level')
+        if changes:
+            run(supabase.table("products").update(changes).eq("id", product_id))
+            updated.append(product_id)
+    if updated:
+        _sync_products(run(supabase.table("branch_products").select("*")
+            .eq("branch_id", BRANCH_ID).in_("id", updated)).data)
+    set_stock_levels(targets)
+    set_min_stock_levels(levels)
+
+def set_stock_levels(targets):
+    """Sets {product_id: stock count} for this branch in one batch, as 'adjust' movements."""
+    if not targets:
+        return []
+    targets = {str(k): int(v) for k, v in targets.items()}
+    rows = run(supabase.rpc("set_stock_levels", {"p_branch": BRANCH_ID, "targets": targets})).data
+    _sync_products(rows)
+    return rows
+
+def set_min_stock_levels(levels):
+    """Writes {product_id: alert level} for this branch in one batch."""
+    if not levels:
+        return []
+    levels = {str(k): (int(v) if v is not None else None) for k, v in levels.items()}
+    rows = run(supabase.rpc("set_min_stock_levels", {"p_branch": BRANCH_ID, "levels": levels})).data
+    _sync_products(rows)
+    return rows
+
+# --- Inventory Grid ---
+# Filtering, sorting and paging run in Postgres (see 012_inventory_grid.sql), so the
+# grid only ever holds one page of rows however large the catalog is.
+
+GRID_COLUMNS = ('id', 'name', 'category', 'sku', 'barcode', 'hsn_code', 'gst_rate',
+                'current_stock', 'selling_price', 'min_stock_level')
+GRID_SORTS = ('name', 'category', 'sku', 'current_stock', 'selling_price')
+
+def _ilike_escape(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def fetch_product_page(page, page_size=50, name=None, category=None, sort="name", descending=False):
+    """One page of this branch's products, filtered and sorted server-side. Returns (rows, total)."""
+    if sort not in GRID_SORTS:
+        raise ValueError(f"Unknown sort column: {sort}")
+    query = supabase.table("branch_products").select(",".join(GRID_COLUMNS), count="exact").eq("branch_id", BRANCH_ID)
+    if category:
+        query = query.eq("category", category)
+    if name and name.strip():
+        query = query.ilike("name", f"%{_ilike_escape(name.strip())}%")
+    query = query.order(sort, desc=descending).order("id", desc=descending).range(page * page_size, (page + 1) * page_size - 1)
+    res = run(query)
+    return res.data, res.count or 0
+
+def fetch_categories():
+    """Distinct product categories, for the grid's filter."""
+    return [row['category'] for row in run(supabase.rpc("product_categories")).data]
+
+# --- Branches ---
+
+def fetch_branches():
+    """All branches, in id order."""
+    return run(supabase.table("branches").select("*").order("id")).data
+
+def transfer_stock(to_branch, items, transfer_key=None):
+    """Moves [{product_id, quantity}] from this branch to another in one atomic call.
+
+    The database refuses the whole transfer if any quantity is not positive or this
+    branch is short on any product. Replaying the same `transfer_key` with the same
+    lines does not move the stock twice. As with sales, the key sent is derived from
+    the destination and lines, so a transfer edited after a failed attempt is a new
+    transfer.
     """
-    sale_data = {
-        "customer_phone": customer_phone,
-        "total_amount": total_amount,
-        "payment_mode": payment_mode
-    }
-    # Insert sale and get the ID
-    sale_response = supabase.table("sales").insert(sale_data).execute()
-    sale_id = sale_response.data[0]['id']
-    
-    # Insert items into sale_items
-    for item in items:
-        item['sale_id'] = sale_id
-        supabase.table("sale_items").insert(item).execute()
-        # Update inventory too
-        update_stock_level(item['product_id'], item['quantity'])
-    
-    return sale_id
-
-def fetch_analytics_data():
-    """Fetches a joined view of sales and items to calculate profit."""
-    # We join sale_items with products to get the cost_price
-    query = """
-    SELECT 
-        s.created_at,
-        si.quantity,
-        si.price_at_sale,
-        p.cost_price,
-        p.name as product_name
-    FROM sale_items si
-    JOIN sales s ON si.sale_id = s.id
-    JOIN products p ON si.product_id = p.id
+    params = {"p_from": BRANCH_ID, "p_to": to_branch, "items": items}
+    payload = json.dumps(params, sort_keys=True, default=str)
+    params["p_key"] = str(uuid.uuid5(uuid.UUID(transfer_key), payload)) if transfer_key else str(uuid.uuid4())
+    rows = run(supabase.rpc("transfer_stock", params)).data
+    _sync_products([row for row in rows if row['branch_id'] == BRANCH_ID])
+    return rows
+
+# --- Customer Directory ---
+# 'customers' is keyed by normalized phone and keeps visit count, lifetime spend and
+# last purchase, updated incrementally inside the create_sale and void_sale RPCs.
+
+def normalize_phone(phone):
+    """Digits only, with 91 prefixed to bare 10-digit numbers. Shared with WhatsApp links."""
+    phone = "".join(ch for ch in str(phone or "") if ch.isdigit())
+    if not phone.startswith('91') and len(phone) == 10:
+        phone = '91' + phone
+    return phone
+
+def search_customers(prefix, limit=8):
+    """Customers whose phone starts with the typed digits, with or without the 91 prefix."""
+    digits = "".join(ch for ch in str(prefix or "") if ch.isdigit())
+    if not digits:
+        return []
+    res = run(supabase.table("customers").select("*")
+        .or_(f"phone.like.{digits}*,phone.like.91{digits}*")
+        .order("last_purchase_at", desc=True).limit(limit))
+    return res.data
+
+def fetch_customer(phone):
+    """Lifetime stats for one customer, or None if they have never bought."""
+    res = run(supabase.table("customers").select("*").eq("phone", normalize_phone(phone)).limit(1))
+    return res.data[0] if res.data else None
+
+def fetch_customer_history(phone, limit=50):
+    """Most recent sales for one customer, newest first."""
+    res = run(supabase.table("sales").select("*").eq("customer_phone", normalize_phone(phone))
+        .order("created_at", desc=True).limit(limit))
+    return res.data
+
+# --- Billing Functions ---
+
+def create_sale_record(customer_phone, total_amount, payment_mode, items, idempotency_key=None, tax_summary=None):
     """
-    response = supabase.rpc('get_analytics').execute() # Or a standard select if no RPC
-    # For simplicity, let's fetch the raw sale_items and handle joins in Pandas
-    sales = supabase.table("sales").select("*").execute()
-    items = supabase.table("sale_items").select("*, products(name, cost_price)").execute()
-    return sales.data, items.data
+    Records the sale, its 'sale_items', the stock deduction and the customer's stats
+    in one database transaction (the 'create_sale' RPC).
+
+    `tax_summary` holds the bill's discount/taxable/cgst/sgst/round_off totals in rupees,
+    stored on the sale alongside the per-line tax fields carried in `items`.
+
+    Calls with the same `idempotency_key` and the same bill return the first sale
+    instead of recording another, so the call is retried safely and a double-click
+    cannot bill twice. The key sent is derived from the bill's contents, so a bill
+    edited after a failed attempt is recorded as itself, not answered with the
+    earlier sale.
+    """
+    params = {
+        "p_branch": BRANCH_ID,
+        "p_phone": normalize_phone(customer_phone),
+        "p_total": float(total_amount),
+        "p_payment": payment_mode,
+        "p_items": items,
+        "p_summary": tax_summary,
+    }
+    payload = json.dumps(params, sort_keys=True, default=str)
+    params["p_key"] = str(uuid.uuid5(uuid.UUID(idempotency_key), payload)) if idempotency_key else str(uuid.uuid4())
+    result = run(supabase.rpc("create_sale", params)).data
+    _sync_products(result['products'])
+    return result['sale_id']
 
 def void_transaction(sale_id):
-    """Reverses a sale: Restores stock and deletes the sale record."""
-    # 1. Get the items from the sale to know what to put back
-    items_res = supabase.table("sale_items").select("product_id, quantity").eq("sale_id", sale_id).execute()
-    
-    for item in items_res.data:
-        # Get current stock
-        prod = supabase.table("products").select("current_stock").eq("id", item['product_id']).single().execute()
-        new_stock = prod.data['current_stock'] + item['quantity']
-        
-        # Restore stock
-        supabase.table("products").update({"current_stock": new_stock}).eq("id", item['product_id']).execute()
-    
-    # 2. Delete the sale (Cascade will delete sale_items automatically)
-    supabase.table("sales").delete().eq("id", sale_id).execute()
+    """Reverses a sale: restores stock, reverses customer stats and deletes the sale record.
+
+    Runs as one transaction; voiding an already-voided sale does nothing.
+    """
+    rows = run(supabase.rpc("void_sale", {"p_sale_id": sale_id})).data
+    _sync_products(rows)
+
+INVOICE_FIELDS = (
+    "id, created_at, customer_phone, payment_mode, total_amount, discount_amount, taxable_amount, "
+    "cgst_amount, sgst_amount, round_off, sale_items(quantity, price_at_sale, hsn_code, gst_rate, "
+    "taxable_value, cgst_amount, sgst_amount, products(name))"
+)
+
+def fetch_sales_with_items(range_start, range_end):
+    """This branch's sales in [range_start, range_end) with their lines, for rendering invoices."""
+    return run(supabase.table("sales").select(INVOICE_FIELDS).eq("branch_id", BRANCH_ID)
+               .gte("created_at", range_start).lt("created_at", range_end)
+               .order("created_at")).data
+
+def fetch_sale_with_items(sale_id):
+    """One sale with its lines, or None if it does not exist (e.g. voided)."""
+    rows = run(supabase.table("sales").select(INVOICE_FIELDS).eq("id", sale_id).limit(1)).data
+    return rows[0] if rows else None
+
+# --- Shop Settings ---
+# Read on nearly every rerun (billing header, invoices, WhatsApp links), so served from an
+# in-process copy that the background jobs refresh and every update replaces.
+
+SETTINGS_TTL = 600  # seconds
+_settings = None    # (loaded_at, row)
+_settings_lock = threading.Lock()
+
+def refresh_shop_settings():
+    """Reloads this branch's settings row into the cache and returns it."""
+    global _settings
+    row = run(supabase.table("shop_settings").select("*").eq("branch_id", BRANCH_ID).single()).data
+    with _settings_lock:
+        _settings = (time.monotonic(), row)
+    return row
 
 def fetch_shop_settings():
-    """Fetches the single row of shop configuration."""
-    res = supabase.table("shop_settings").select("*").eq("id", 1).single().execute()
-    return res.data
+    """This branch's row of shop configuration, from the cache when fresh."""
+    with _settings_lock:
+        cached = _settings
+    if cached and time.monotonic() - cached[0] < SETTINGS_TTL:
+        return cached[1]
+    return refresh_shop_settings()
 
 def update_shop_settings(data):
-    """Updates the shop profile details."""
-    return supabase.table("shop_settings").update(data).eq("id", 1).execute()
\ No newline at end of file
+    """Updates this branch's shop profile details."""
+    res = run(supabase.table("shop_settings").update(data).eq("branch_id", BRANCH_ID))
+    refresh_shop_settings()
+    return res
\ No newline at end of file
@@ -0,0 +1,112 @@
+import os
+import random
+import threading
+import time
+import httpx
+from postgrest.exceptions import APIError
+
+# --- Resilient Query Runner ---
+# Every Supabase call goes through run(): HTTP calls are bounded by DB_TIMEOUT (set on
+# the client in src/database.py), transport failures are retried with full-jitter
+# exponential backoff when the call is safe to repeat, and a circuit breaker fails
+# fast while the backend is down so Streamlit threads do not pile up waiting on it.
+
+DB_TIMEOUT = float(os.environ.get("DB_TIMEOUT", 10))  # seconds per HTTP call
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.2   # seconds
+BACKOFF_CAP = 3.0    # seconds
+BREAKER_THRESHOLD = 5      # consecutive failures before opening
+BREAKER_RESET_AFTER = 30   # seconds before a trial call is let through
+
+# Failures worth retrying: the request never reached the database or timed out.
+TRANSIENT_ERRORS = (httpx.TransportError,)
+# PostgREST/Postgres error codes meaning the backend is unavailable or overloaded rather
+# than rejecting the request: statement timeout, shutdown/restart, connection failures,
+# too many connections, serialization/deadlock aborts and PostgREST's own DB errors.
+TRANSIENT_CODES = {
+    "57014", "57P01", "57P02", "57P03", "53300", "08000", "08001", "08003", "08004", "08006",
+    "40001", "40P01", "PGRST000", "PGRST001", "PGRST002",
+}
+
+def _is_transient(error):
+    """True for APIErrors caused by an unhealthy backend (5xx or a transient SQLSTATE)."""
+    code = str(getattr(error, "code", "") or "")
+    return code in TRANSIENT_CODES or (len(code) == 3 and code.isdigit() and code >= "500")
+
+def is_rejection(error):
+    """True when the database answered and refused the call, so the call wrote nothing."""
+    return isinstance(error, APIError) and not _is_transient(error)
+
+class DatabaseUnavailable(Exception):
+    """Raised without contacting Supabase while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures; lets one trial call through after a cool-down."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET_AFTER):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise DatabaseUnavailable("Database is unreachable; retrying shortly.")
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker()
+
+def _backoff(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def run(query, idempotent=True, retries=MAX_RETRIES):
+    """Executes a postgrest query/RPC builder and returns its response.
+
+    Only idempotent calls are retried; everything else fails on the first transport error
+    so a write is never applied twice.
+    """
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            response = query.execute()
+        except (*TRANSIENT_ERRORS, APIError) as e:
+            if is_rejection(e):
+                # The database answered; the request itself was rejected
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if not idempotent or attempt >= retries:
+                raise
+            time.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return response
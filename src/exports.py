@@ -0,0 +1,79 @@
+import csv
+import io
+import tempfile
+from openpyxl import Workbook
+from src.database import supabase, BRANCH_ID
+from src.db_client import run
+
+# --- Streaming Exports ---
+# Rows are pulled page by page with keyset pagination and written straight to a
+# temp file, so memory stays flat no matter how many rows are exported.
+
+PAGE_SIZE = 1000
+
+SALES_LEDGER_COLUMNS = ['created_at', 'sale_id', 'customer_phone', 'payment_mode',
+                        'product_name', 'hsn_code', 'quantity', 'price_at_sale', 'discount_percent',
+                        'taxable_value', 'gst_rate', 'cgst_amount', 'sgst_amount', 'line_total', 'cost_price']
+INVENTORY_COLUMNS = ['name', 'category', 'sku', 'barcode', 'cost_price', 'selling_price',
+                     'current_stock', 'min_stock_level']
+
+def iter_rows(table, columns, key="id", filters=(), page_size=PAGE_SIZE):
+    """Yields rows of `table` in `key` order, one page per round trip.
+
+    `filters` is a sequence of (method, column, value) tuples applied to each page query,
+    e.g. ("gte", "created_at", "2024-04-01").
+    """
+    last = None
+    select = ", ".join(dict.fromkeys([key] + list(columns)))
+    while True:
+        query = supabase.table(table).select(select).order(key).limit(page_size)
+        for method, column, value in filters:
+            query = getattr(query, method)(column, value)
+        if last is not None:
+            query = query.gt(key, last)
+        page = run(query).data
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1][key]
+
+def iter_sales_ledger(range_start, range_end):
+    """This branch's sale lines between two ISO timestamps (end exclusive)."""
+    filters = [("eq", "branch_id", BRANCH_ID), ("gte", "created_at", range_start), ("lt", "created_at", range_end)]
+    return iter_rows("sales_ledger", SALES_LEDGER_COLUMNS, key="line_id", filters=filters)
+
+def iter_inventory():
+    """Every product in the catalog with this branch's stock."""
+    return iter_rows("branch_products", INVENTORY_COLUMNS, filters=[("eq", "branch_id", BRANCH_ID)])
+
+def write_csv(rows, columns):
+    """Writes rows to a temp CSV file and returns it rewound for reading."""
+    out = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.DictWriter(text, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+    text.flush()
+    text.detach()
+    out.seek(0)
+    return out
+
+def write_xlsx(rows, columns, sheet_name="Export"):
+    """Writes rows with openpyxl's write-only mode to a temp XLSX file and returns it rewound."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append(columns)
+    for row in rows:
+        ws.append([row.get(col) for col in columns])
+    out = tempfile.TemporaryFile()
+    wb.save(out)
+    out.seek(0)
+    return out
+
+def build_export(rows, columns, fmt, sheet_name="Export"):
+    """Returns (file, mime) for 'xlsx' or 'csv'."""
+    if fmt == "xlsx":
+        return write_xlsx(rows, columns, sheet_name), \
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    return write_csv(rows, columns), "text/csv"
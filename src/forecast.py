@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from src.database import supabase, get_catalog, BRANCH_ID
+from src.db_client import run
+from src.analytics import shop_today
+
+# --- Reorder Forecasting ---
+# The product_demand_stats RPC reduces the daily_product_sales rollup to one row per
+# product (weighted unit sums, recent and total units), so only those rows cross the
+# wire. Every statistic is then finished for all SKUs at once with numpy arrays.
+
+HISTORY_DAYS = 730
+EWMA_SPAN = 28          # days; alpha = 2 / (span + 1)
+VELOCITY_WINDOW = 30    # days used for the plain recent-velocity figure
+LEAD_TIME_DAYS = 7      # supplier lead time
+REVIEW_DAYS = 14        # how often stock is reordered
+SERVICE_Z = 1.65        # ~95% service level
+PAGE_SIZE = 1000
+
+def fetch_demand_stats(end_date, history_days=HISTORY_DAYS, span=EWMA_SPAN):
+    """Per-product demand sums for this branch over the `history_days` ending at `end_date`.
+
+    Returns a DataFrame with product_id, ew_units, ew_sq_units (sums of units and
+    units^2 weighted by alpha * (1 - alpha)^age), recent_units and total_units.
+    Pages by product id, one page per PAGE_SIZE products that sold in the window.
+    """
+    rows, after = [], None
+    while True:
+        page = run(supabase.rpc("product_demand_stats", {
+            "p_branch": BRANCH_ID, "p_end": end_date.isoformat(), "p_days": history_days,
+            "p_alpha": 2.0 / (span + 1), "p_recent_days": VELOCITY_WINDOW,
+            "p_after": after, "p_limit": PAGE_SIZE,
+        })).data
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        after = page[-1]['product_id']
+    return pd.DataFrame(rows, columns=["product_id", "ew_units", "ew_sq_units", "recent_units", "total_units"])
+
+def compute_forecast(product_ids, stock, stats, history_days=HISTORY_DAYS, span=EWMA_SPAN,
+                     lead_time=LEAD_TIME_DAYS, review_days=REVIEW_DAYS, service_z=SERVICE_Z):
+    """Velocity, EWMA demand, days of cover and reorder suggestions for every product.
+
+    `product_ids`/`stock` describe the catalog; `stats` is fetch_demand_stats() output
+    computed with the same `history_days` and `span`. Returns a DataFrame indexed like
+    `product_ids`.
+    """
+    n = len(product_ids)
+    stock = np.asarray(stock, dtype=np.float64)
+
+    # Line each product's sums up with its catalog position; products that sold
+    # nothing stay at zero, and stats for products not in the catalog are dropped
+    pos = pd.Index(product_ids).get_indexer(stats['product_id'])
+    keep = pos >= 0
+
+    def column(name):
+        values = np.zeros(n)
+        values[pos[keep]] = stats[name].to_numpy(dtype=np.float64)[keep]
+        return values
+
+    # EWMA over a daily series where missing days are zero, renormalised for the
+    # finite window
+    alpha = 2.0 / (span + 1)
+    norm = 1 - (1 - alpha) ** history_days
+    ewma = column('ew_units') / norm
+    ew_sq = column('ew_sq_units') / norm
+    ew_std = np.sqrt(np.maximum(ew_sq - ewma ** 2, 0))
+
+    velocity = column('recent_units') / VELOCITY_WINDOW
+    total_units = column('total_units')
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(ewma > 0, stock / ewma, np.inf)
+
+    safety_stock = service_z * ew_std * np.sqrt(lead_time)
+    alert_level = np.ceil(ewma * lead_time + safety_stock)
+    reorder_qty = np.maximum(np.ceil(ewma * (lead_time + review_days) + safety_stock - stock), 0)
+
+    return pd.DataFrame({
+        "id": product_ids,
+        "current_stock": stock,
+        "units_sold": total_units,
+        "velocity": velocity,
+        "ewma_demand": ewma,
+        "days_of_cover": days_of_cover,
+        "suggested_alert_level": alert_level.astype(np.int64),
+        "reorder_qty": reorder_qty.astype(np.int64),
+    })
+
+def build_reorder_forecast(history_days=HISTORY_DAYS):
+    """Runs the forecast over the cached catalog and the last `history_days` of sales."""
+    catalog = get_catalog()
+    stats = fetch_demand_stats(shop_today(), history_days)
+
+    result = compute_forecast(
+        [p['id'] for p in catalog], [p['current_stock'] for p in catalog],
+        stats, history_days=history_days,
+    )
+    result.insert(1, "name", [p['name'] for p in catalog])
+    result["min_stock_level"] = [p.get('min_stock_level') for p in catalog]
+    return result.sort_values("days_of_cover")
@@ -0,0 +1,37 @@
+from src.scheduler import scheduler
+from src.database import refresh_catalog, save_catalog_snapshot, refresh_shop_settings, take_stock_snapshot, compact_stock_ledger
+from src.analytics import warm_analytics_cache, CACHE_TTL
+from src.utils import prerender_invoices
+
+# --- Background Maintenance Jobs ---
+# Registered once per process on first page load. Intervals are in seconds.
+
+ANALYTICS_INTERVAL = CACHE_TTL - 60   # refresh the default Insights views before they expire
+CACHE_WARM_INTERVAL = 10 * 60
+INVOICE_INTERVAL = 5 * 60
+COMPACTION_INTERVAL = 24 * 60 * 60
+COMPACTION_DELAY = 60 * 60            # keep heavy maintenance away from startup
+LEDGER_KEEP_DAYS = 90
+
+def warm_caches():
+    """Delta-syncs the product catalog, persists its snapshot and reloads shop settings."""
+    refresh_catalog()
+    save_catalog_snapshot()
+    refresh_shop_settings()
+
+def compact_ledger():
+    """Snapshots stock, then folds old stock movements into the snapshots."""
+    take_stock_snapshot()
+    compact_stock_ledger(LEDGER_KEEP_DAYS)
+
+def start_background_jobs():
+    """Registers the maintenance jobs and starts the scheduler; cheap to call on every rerun."""
+    scheduler.register("warm_caches", warm_caches, CACHE_WARM_INTERVAL,
+                       description="Catalog delta sync and shop settings reload")
+    scheduler.register("analytics_rollup", warm_analytics_cache, ANALYTICS_INTERVAL,
+                       description="Recompute default Insights aggregates")
+    scheduler.register("prerender_invoices", prerender_invoices, INVOICE_INTERVAL,
+                       description="Render today's invoices for instant reprints")
+    scheduler.register("compact_ledger", compact_ledger, COMPACTION_INTERVAL, delay=COMPACTION_DELAY,
+                       description=f"Stock snapshot + compact movements older than {LEDGER_KEEP_DAYS} days")
+    scheduler.start()
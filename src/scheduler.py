@@ -0,0 +1,129 @@
+import threading
+import time
+from datetime import datetime
+
+# --- Background Job Scheduler ---
+# One daemon thread per server process (not per Streamlit session) runs registered jobs
+# on fixed intervals. Jobs are single-flight: a run, scheduled or manual, is skipped
+# while the previous one is still going. Each job keeps timing and outcome metrics
+# for the admin view on the Settings page.
+
+TICK = 5  # seconds between checks for due jobs
+
+class Job:
+    """A named callable run every `interval` seconds, first after `delay` seconds."""
+
+    def __init__(self, name, func, interval, delay=0, description=""):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.description = description
+        self.next_run = time.monotonic() + delay
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_seconds = 0.0
+        self.last_started = None
+        self.last_seconds = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def due(self, now):
+        return now >= self.next_run
+
+    def run(self):
+        """Runs the job unless a run is already in progress. Returns False when skipped."""
+        if not self._lock.acquire(blocking=False):
+            self.skipped += 1
+            return False
+        try:
+            self.last_started = datetime.now()
+            started = time.perf_counter()
+            try:
+                self.func()
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+            self.last_seconds = time.perf_counter() - started
+            self.total_seconds += self.last_seconds
+            self.runs += 1
+            self.next_run = time.monotonic() + self.interval
+        finally:
+            self._lock.release()
+        return True
+
+    def status(self):
+        return {
+            "job": self.name,
+            "description": self.description,
+            "every_min": round(self.interval / 60, 1),
+            "state": "running" if self.running else ("failing" if self.last_error else "idle"),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_run": self.last_started,
+            "last_secs": self.last_seconds,
+            "avg_secs": self.total_seconds / self.runs if self.runs else None,
+            "next_in_secs": max(0, round(self.next_run - time.monotonic())),
+            "last_error": self.last_error,
+        }
+
+class Scheduler:
+    """Runs due jobs one after another on a single daemon thread."""
+
+    def __init__(self, tick=TICK):
+        self.tick = tick
+        self.jobs = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def register(self, name, func, interval, delay=0, description=""):
+        """Adds a job; registering an existing name keeps the original (and its metrics)."""
+        with self._lock:
+            if name not in self.jobs:
+                self.jobs[name] = Job(name, func, interval, delay, description)
+            return self.jobs[name]
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the worker thread once per process. Returns False if it was already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="haveli-scheduler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for job in list(self.jobs.values()):
+                if job.due(now):
+                    job.run()
+            self._stop.wait(self.tick)
+
+    def run_now(self, name):
+        """Triggers a job on its own thread. Returns False if it is already running."""
+        job = self.jobs[name]
+        if job.running:
+            return False
+        threading.Thread(target=job.run, name=f"haveli-job-{name}", daemon=True).start()
+        return True
+
+    def status(self):
+        return [job.status() for job in self.jobs.values()]
+
+scheduler = Scheduler()
@@ -1,12 +1,20 @@
 from reportlab.lib.pagesizes import A5
 from reportlab.pdfgen import canvas
 import io
+import threading
 import urllib.parse
-from src.database import fetch_shop_settings
+from decimal import Decimal
+import pandas as pd
+from src.database import fetch_shop_settings, normalize_phone, fetch_sales_with_items, fetch_sale_with_items
+from src.analytics import SHOP_TZ, shop_today, day_bounds
 from datetime import datetime
 
-def generate_invoice_pdf(sale_id, items, total_amount, customer_phone="", payment_mode="Cash"):
-    """Generates a detailed PDF invoice with fixed line alignment."""
+def generate_invoice_pdf(sale_id, items, total_amount, customer_phone="", payment_mode="Cash", tax_summary=None, invoice_date=None):
+    """Generates a detailed PDF invoice with fixed line alignment.
+
+    `tax_summary` (rupee totals plus an 'hsn' list of {hsn, rate, taxable, cgst, sgst})
+    adds the HSN-wise GST breakup above the total. `invoice_date` defaults to now.
+    """
     try:
         shop = fetch_shop_settings()
         if shop is None: shop = {}
@@ -16,6 +24,7 @@ def generate_invoice_pdf(sale_id, items, total_amount, customer_phone="", paymen
     shop_name = shop.get('shop_name') or "HAVELI ELECTRICALS"
     shop_address = shop.get('shop_address') or ""
     shop_contact = shop.get('shop_contact') or ""
+    shop_gstin = shop.get('gstin') or ""
 
     buffer = io.BytesIO()
     p = canvas.Canvas(buffer, pagesize=A5)
@@ -27,7 +36,8 @@ def generate_invoice_pdf(sale_id, items, total_amount, customer_phone="", paymen
     
     p.setFont("Helvetica", 8)
     p.drawCentredString(width/2, height - 55, str(shop_address)[:65])
-    p.drawCentredString(width/2, height - 65, f"Contact: {shop_contact}")
+    contact_line = f"Contact: {shop_contact}" + (f"  |  GSTIN: {shop_gstin}" if shop_gstin else "")
+    p.drawCentredString(width/2, height - 65, contact_line)
     
     p.line(30, height - 75, width - 30, height - 75)
 
@@ -36,7 +46,7 @@ def generate_invoice_pdf(sale_id, items, total_amount, customer_phone="", paymen
     p.drawString(30, height - 95, f"Invoice ID: {sale_id[:8]}")
     p.drawString(30, height - 110, f"Customer: {customer_phone if customer_phone else 'Walk-in'}")
     p.drawRightString(width - 30, height - 95, f"Payment: {payment_mode}")
-    p.drawRightString(width - 30, height - 110, f"Date: {datetime.now().strftime('%d-%m-%Y')}")
+    p.drawRightString(width - 30, height - 110, f"Date: {(invoice_date or datetime.now()).strftime('%d-%m-%Y')}")
 
     # --- Table Header ---
     p.setFont("Helvetica-Bold", 10)
@@ -69,6 +79,52 @@ def generate_invoice_pdf(sale_id, items, total_amount, customer_phone="", paymen
             p.showPage()
             y = height - 50
 
+    # --- GST Breakup (HSN-wise) ---
+    if tax_summary:
+        def draw_hsn_header(y):
+            p.setFont("Helvetica-Bold", 8)
+            p.drawString(30, y, "HSN")
+            p.drawRightString(width - 190, y, "Taxable")
+            p.drawRightString(width - 140, y, "GST %")
+            p.drawRightString(width - 85, y, "CGST")
+            p.drawRightString(width - 30, y, "SGST")
+            p.setFont("Helvetica", 8)
+
+        if y < 120:
+            p.showPage()
+            y = height - 50
+        y -= 4
+        p.line(30, y, width - 30, y)
+        y -= 14
+        draw_hsn_header(y)
+        for row in tax_summary['hsn']:
+            y -= 12
+            # Continue the table on a new page, repeating its header
+            if y < 80:
+                p.showPage()
+                y = height - 50
+                draw_hsn_header(y)
+                y -= 12
+            p.drawString(30, y, str(row['hsn']))
+            p.drawRightString(width - 190, y, f"{row['taxable']:,.2f}")
+            p.drawRightString(width - 140, y, f"{row['rate']:g}")
+            p.drawRightString(width - 85, y, f"{row['cgst']:,.2f}")
+            p.drawRightString(width - 30, y, f"{row['sgst']:,.2f}")
+
+        # Keep the tax totals and the grand total together on one page
+        if y < 80 + 8 + 12 * 5 + 35:
+            p.showPage()
+            y = height - 50
+        y -= 8
+        p.setFont("Helvetica", 9)
+        for label, key in (("Discount", 'discount'), ("Taxable Value", 'taxable'), ("CGST", 'cgst'),
+                           ("SGST", 'sgst'), ("Round Off", 'round_off')):
+            if key == 'discount' and not tax_summary[key]:
+                continue
+            y -= 12
+            p.drawRightString(width - 100, y, label)
+            p.drawRightString(width - 30, y, f"{tax_summary[key]:,.2f}")
+
     # --- Footer ---
     y -= 10
     p.line(30, y, width - 30, y)
@@ -83,6 +139,74 @@ def generate_invoice_pdf(sale_id, items, total_amount, customer_phone="", paymen
     buffer.seek(0)
     return buffer
 
+# --- Invoice Cache ---
+# Rendered PDFs keyed by sale id. The background jobs pre-render the day's sales so
+# reprints are instant; anything older is rendered on first request.
+
+_invoices = {}  # sale id -> PDF bytes
+_invoices_lock = threading.Lock()
+
+def _sale_tax_summary(sale):
+    """Rebuilds the invoice tax breakup from a stored sale, or None for pre-GST sales."""
+    if sale.get('taxable_amount') is None:
+        return None
+    groups = {}
+    for line in sale['sale_items']:
+        key = (line.get('hsn_code') or "-", Decimal(str(line.get('gst_rate') or 0)))
+        totals = groups.setdefault(key, [Decimal(0)] * 3)
+        for i, field in enumerate(('taxable_value', 'cgst_amount', 'sgst_amount')):
+            totals[i] += Decimal(str(line.get(field) or 0))
+    summary = {k: float(sale.get(f"{k}_amount" if k != 'round_off' else k) or 0)
+               for k in ('discount', 'taxable', 'cgst', 'sgst', 'round_off')}
+    summary['hsn'] = [
+        {"hsn": hsn, "rate": float(rate), "taxable": float(t), "cgst": float(c), "sgst": float(g)}
+        for (hsn, rate), (t, c, g) in sorted(groups.items())
+    ]
+    return summary
+
+def render_sale_invoice(sale):
+    """PDF bytes for a sale fetched with its lines (see fetch_sales_with_items)."""
+    items = [{"name": (line.get('products') or {}).get('name') or "Item",
+              "quantity": line['quantity'], "price": float(line['price_at_sale'])}
+             for line in sale['sale_items']]
+    sold_at = pd.Timestamp(sale['created_at']).tz_convert(SHOP_TZ)
+    return generate_invoice_pdf(
+        sale['id'], items, float(sale['total_amount']), sale.get('customer_phone') or "",
+        sale.get('payment_mode') or "Cash", _sale_tax_summary(sale), sold_at,
+    ).getvalue()
+
+def get_invoice_pdf(sale_id):
+    """Cached PDF bytes for a sale, rendering it if needed. None if the sale is gone."""
+    with _invoices_lock:
+        pdf = _invoices.get(sale_id)
+    if pdf is None:
+        sale = fetch_sale_with_items(sale_id)
+        if sale is None:
+            return None
+        pdf = render_sale_invoice(sale)
+        with _invoices_lock:
+            _invoices[sale_id] = pdf
+    return pdf
+
+def prerender_invoices():
+    """Renders today's not-yet-cached invoices and drops every other cached one. Returns the count rendered."""
+    today = shop_today()
+    range_start, range_end = day_bounds(today, today)
+    sales = fetch_sales_with_items(range_start, range_end)
+    with _invoices_lock:
+        cached = {sale['id']: _invoices[sale['id']] for sale in sales if sale['id'] in _invoices}
+    rendered = {sale['id']: render_sale_invoice(sale) for sale in sales if sale['id'] not in cached}
+    with _invoices_lock:
+        _invoices.clear()
+        _invoices.update(cached)
+        _invoices.update(rendered)
+    return len(rendered)
+
+def clear_invoice_cache():
+    """Drops rendered invoices, e.g. after the shop profile changes."""
+    with _invoices_lock:
+        _invoices.clear()
+
 def get_whatsapp_link(phone, amount):
     """Generates a WhatsApp magic link with dynamic shop name."""
     try:
@@ -94,8 +218,6 @@ def get_whatsapp_link(phone, amount):
     message = f"Hello! Your invoice from {shop_name} for Rs. {amount:,.2f} has been generated. Thank you!"
     encoded_msg = urllib.parse.quote(message)
     
-    phone = str(phone).strip()
-    if not phone.startswith('91') and len(phone) == 10:
-        phone = '91' + phone
+    phone = normalize_phone(phone)
         
     return f"https://wa.me/{phone}?text={encoded_msg}"
\ No newline at end of file
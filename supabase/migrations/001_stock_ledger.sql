@@ -0,0 +1,105 @@
+-- Append-only stock movement ledger.
+-- products.current_stock stays as the running total; every change to it is
+-- recorded here first so stock can be reconstructed for any point in time.
+
+create table if not exists stock_movements (
+    id bigint generated always as identity primary key,
+    product_id uuid not null references products(id) on delete cascade,
+    delta integer not null,
+    reason text not null check (reason in ('sale', 'void', 'adjust', 'import')),
+    ref_id uuid,
+    created_at timestamptz not null default now()
+);
+create index if not exists stock_movements_product_idx on stock_movements (product_id, id);
+create index if not exists stock_movements_created_idx on stock_movements (created_at);
+
+-- Periodic per-product snapshots. last_movement_id is the ledger watermark the
+-- snapshot already includes, so a point-in-time read is one snapshot plus the
+-- movements after it.
+create table if not exists stock_snapshots (
+    id bigint generated always as identity primary key,
+    product_id uuid not null references products(id) on delete cascade,
+    stock integer not null,
+    last_movement_id bigint not null default 0,
+    taken_at timestamptz not null default now()
+);
+create index if not exists stock_snapshots_product_idx on stock_snapshots (product_id, taken_at desc);
+
+-- Baseline so products that predate the ledger have a starting point.
+insert into stock_snapshots (product_id, stock, last_movement_id)
+select id, current_stock, 0 from products;
+
+-- Appends a batch of movements and shifts current_stock in the same transaction.
+-- Returns the updated product rows.
+create or replace function apply_stock_movements(movements jsonb)
+returns setof products
+language sql
+as $$
+    with m as (
+        insert into stock_movements (product_id, delta, reason, ref_id)
+        select (x->>'product_id')::uuid,
+               (x->>'delta')::integer,
+               x->>'reason',
+               nullif(x->>'ref_id', '')::uuid
+        from jsonb_array_elements(movements) as x
+        returning product_id, delta
+    ),
+    totals as (
+        select product_id, sum(delta) as delta from m group by product_id
+    )
+    update products p
+    set current_stock = p.current_stock + t.delta
+    from totals t
+    where p.id = t.product_id
+    returning p.*;
+$$;
+
+-- Snapshots every product at a single ledger watermark. Writers are blocked for
+-- the duration so the snapshot and the watermark agree.
+create or replace function take_stock_snapshot()
+returns bigint
+language plpgsql
+as $$
+declare
+    watermark bigint;
+begin
+    lock table stock_movements in share mode;
+    select coalesce(max(id), 0) into watermark from stock_movements;
+    insert into stock_snapshots (product_id, stock, last_movement_id)
+    select id, current_stock, watermark from products;
+    return watermark;
+end;
+$$;
+
+-- Drops movements already covered by a snapshot older than keep_days and thins
+-- those old snapshots to one per product per month. Returns movements removed.
+create or replace function compact_stock_ledger(keep_days integer default 90)
+returns integer
+language plpgsql
+as $$
+declare
+    cutoff timestamptz := now() - make_interval(days => keep_days);
+    floor_id bigint;
+    removed integer;
+begin
+    select max(last_movement_id) into floor_id
+    from stock_snapshots where taken_at <= cutoff;
+    if floor_id is null then
+        return 0;
+    end if;
+
+    delete from stock_movements where id <= floor_id;
+    get diagnostics removed = row_count;
+
+    delete from stock_snapshots s
+    where s.taken_at <= cutoff
+      and s.id not in (
+          select distinct on (product_id, date_trunc('month', taken_at)) id
+          from stock_snapshots
+          where taken_at <= cutoff
+          order by product_id, date_trunc('month', taken_at), taken_at desc
+      );
+
+    return removed;
+end;
+$$;
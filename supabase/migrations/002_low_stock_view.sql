@@ -0,0 +1,11 @@
+-- Server-side low-stock filter. The partial index only holds rows that are at
+-- or below their alert level, so the view reads just those rows.
+
+create index if not exists products_low_stock_idx
+    on products (current_stock)
+    where current_stock <= min_stock_level;
+
+create or replace view low_stock_products as
+select id, name, current_stock, min_stock_level
+from products
+where current_stock <= min_stock_level;
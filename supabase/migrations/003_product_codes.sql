@@ -0,0 +1,7 @@
+-- SKU and barcode columns for scan-mode billing. Both are unique when set.
+
+alter table products add column if not exists sku text;
+alter table products add column if not exists barcode text;
+
+create unique index if not exists products_sku_idx on products (sku) where sku is not null;
+create unique index if not exists products_barcode_idx on products (barcode) where barcode is not null;
@@ -0,0 +1,52 @@
+-- Date-range analytics. Range filtering and date_trunc bucketing run here so
+-- only the bucketed series is sent to the app.
+
+create index if not exists sales_created_at_idx on sales (created_at);
+create index if not exists sale_items_sale_idx on sale_items (sale_id);
+
+-- Revenue, profit and units per day/week/month between two local dates (inclusive).
+create or replace function sales_series(
+    start_date date,
+    end_date date,
+    bucket text default 'day',
+    tz text default 'Asia/Kolkata'
+)
+returns table (period date, revenue numeric, profit numeric, units bigint)
+language sql
+stable
+as $$
+    select date_trunc(bucket, s.created_at at time zone tz)::date as period,
+           sum(si.quantity * si.price_at_sale) as revenue,
+           sum(si.quantity * (si.price_at_sale - coalesce(p.cost_price, 0))) as profit,
+           sum(si.quantity) as units
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    left join products p on p.id = si.product_id
+    where s.created_at >= (start_date::timestamp at time zone tz)
+      and s.created_at < ((end_date + 1)::timestamp at time zone tz)
+    group by 1
+    order by 1;
+$$;
+
+-- Best sellers by units in the same window.
+create or replace function top_products(
+    start_date date,
+    end_date date,
+    max_rows integer default 8,
+    tz text default 'Asia/Kolkata'
+)
+returns table (product_name text, units bigint)
+language sql
+stable
+as $$
+    select coalesce(p.name, 'Unknown') as product_name,
+           sum(si.quantity) as units
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    left join products p on p.id = si.product_id
+    where s.created_at >= (start_date::timestamp at time zone tz)
+      and s.created_at < ((end_date + 1)::timestamp at time zone tz)
+    group by 1
+    order by 2 desc
+    limit max_rows;
+$$;
@@ -0,0 +1,16 @@
+-- Flat one-row-per-line sales ledger for exports, paged by line_id.
+
+create or replace view sales_ledger as
+select si.id as line_id,
+       s.created_at,
+       s.id as sale_id,
+       s.customer_phone,
+       s.payment_mode,
+       p.name as product_name,
+       si.quantity,
+       si.price_at_sale,
+       si.quantity * si.price_at_sale as line_total,
+       p.cost_price
+from sale_items si
+join sales s on s.id = si.sale_id
+left join products p on p.id = si.product_id;
@@ -0,0 +1,60 @@
+-- Customer directory keyed by normalized phone (digits only, 10-digit numbers
+-- prefixed with 91), with lifetime stats maintained per sale and void.
+
+create or replace function normalize_phone(raw text)
+returns text
+language sql
+immutable
+as $$
+    select case
+        when length(d) = 10 and d not like '91%' then '91' || d
+        else d
+    end
+    from (select regexp_replace(coalesce(raw, ''), '\D', '', 'g') as d) as digits;
+$$;
+
+update sales set customer_phone = normalize_phone(customer_phone)
+where customer_phone is not null and customer_phone <> normalize_phone(customer_phone);
+
+create table if not exists customers (
+    phone text primary key,
+    visit_count integer not null default 0,
+    lifetime_spend numeric not null default 0,
+    last_purchase_at timestamptz
+);
+-- text_pattern_ops lets "like 'prefix%'" use the index for autocomplete.
+create index if not exists customers_phone_prefix_idx on customers (phone text_pattern_ops);
+create index if not exists sales_customer_idx on sales (customer_phone, created_at desc);
+
+insert into customers (phone, visit_count, lifetime_spend, last_purchase_at)
+select customer_phone, count(*), sum(total_amount), max(created_at)
+from sales
+where coalesce(customer_phone, '') <> ''
+group by customer_phone
+on conflict (phone) do nothing;
+
+create or replace function record_customer_sale(p_phone text, p_amount numeric, p_at timestamptz)
+returns setof customers
+language sql
+as $$
+    insert into customers (phone, visit_count, lifetime_spend, last_purchase_at)
+    values (p_phone, 1, p_amount, p_at)
+    on conflict (phone) do update
+    set visit_count = customers.visit_count + 1,
+        lifetime_spend = customers.lifetime_spend + excluded.lifetime_spend,
+        last_purchase_at = greatest(customers.last_purchase_at, excluded.last_purchase_at)
+    returning *;
+$$;
+
+-- Call after the sale row is deleted so last_purchase_at falls back correctly.
+create or replace function reverse_customer_sale(p_phone text, p_amount numeric)
+returns setof customers
+language sql
+as $$
+    update customers c
+    set visit_count = greatest(c.visit_count - 1, 0),
+        lifetime_spend = c.lifetime_spend - p_amount,
+        last_purchase_at = (select max(created_at) from sales where customer_phone = p_phone)
+    where c.phone = p_phone
+    returning *;
+$$;
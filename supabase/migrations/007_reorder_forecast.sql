@@ -0,0 +1,34 @@
+-- Inputs and write-back for the reorder forecast (src/forecast.py).
+
+-- Units sold per product per local day. Ordered so the app can page through it.
+create or replace function daily_product_units(
+    start_date date,
+    end_date date,
+    tz text default 'Asia/Kolkata'
+)
+returns table (product_id uuid, day date, units bigint)
+language sql
+stable
+as $$
+    select si.product_id,
+           (s.created_at at time zone tz)::date as day,
+           sum(si.quantity) as units
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    where s.created_at >= (start_date::timestamp at time zone tz)
+      and s.created_at < ((end_date + 1)::timestamp at time zone tz)
+    group by 1, 2
+    order by 1, 2;
+$$;
+
+-- Batch update of alert levels from {"<product id>": level, ...}. Returns updated rows.
+create or replace function set_min_stock_levels(levels jsonb)
+returns setof products
+language sql
+as $$
+    update products p
+    set min_stock_level = (l.value)::integer
+    from jsonb_each_text(levels) as l
+    where p.id = l.key::uuid
+    returning p.*;
+$$;
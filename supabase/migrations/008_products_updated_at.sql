@@ -0,0 +1,19 @@
+-- updated_at on products drives delta sync of the local catalog snapshot.
+
+alter table products add column if not exists updated_at timestamptz not null default now();
+create index if not exists products_updated_at_idx on products (updated_at, id);
+
+create or replace function touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists products_touch_updated_at on products;
+create trigger products_touch_updated_at
+    before update on products
+    for each row execute function touch_updated_at();
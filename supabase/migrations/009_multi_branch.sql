@@ -0,0 +1,344 @@
+-- Multi-branch inventory. Products stay a shared catalog; stock, alert levels,
+-- settings, sales and the stock ledger are scoped to a branch.
+
+create table if not exists branches (
+    id integer primary key,
+    name text not null unique
+);
+insert into branches (id, name) values (1, 'Main') on conflict do nothing;
+
+-- Stock per branch, list-partitioned by branch_id. Every index below is a
+-- partitioned index, so a terminal's reads, scans and row locks stay inside its
+-- own branch's partition.
+create table if not exists branch_stock (
+    branch_id integer not null references branches(id),
+    product_id uuid not null references products(id) on delete cascade,
+    current_stock integer not null default 0,
+    min_stock_level integer,
+    updated_at timestamptz not null default now(),
+    primary key (branch_id, product_id)
+) partition by list (branch_id);
+create table if not exists branch_stock_1 partition of branch_stock for values in (1);
+create table if not exists branch_stock_default partition of branch_stock default;
+
+create index if not exists branch_stock_updated_idx on branch_stock (branch_id, updated_at);
+create index if not exists branch_stock_low_idx on branch_stock (branch_id, current_stock)
+    where current_stock <= min_stock_level;
+
+drop trigger if exists branch_stock_touch_updated_at on branch_stock;
+create trigger branch_stock_touch_updated_at
+    before update on branch_stock
+    for each row execute function touch_updated_at();
+
+insert into branch_stock (branch_id, product_id, current_stock, min_stock_level)
+select 1, id, current_stock, min_stock_level from products
+on conflict do nothing;
+
+-- Per-branch settings, sales and ledger rows. Existing data belongs to branch 1.
+alter table shop_settings add column if not exists branch_id integer references branches(id);
+update shop_settings set branch_id = 1 where id = 1 and branch_id is null;
+create unique index if not exists shop_settings_branch_idx on shop_settings (branch_id);
+
+alter table sales add column if not exists branch_id integer not null default 1 references branches(id);
+create index if not exists sales_branch_created_idx on sales (branch_id, created_at);
+
+alter table stock_movements add column if not exists branch_id integer not null default 1 references branches(id);
+alter table stock_movements drop constraint if exists stock_movements_reason_check;
+alter table stock_movements add constraint stock_movements_reason_check
+    check (reason in ('sale', 'void', 'adjust', 'import', 'transfer_in', 'transfer_out'));
+create index if not exists stock_movements_branch_idx on stock_movements (branch_id, product_id, id);
+
+alter table stock_snapshots add column if not exists branch_id integer not null default 1 references branches(id);
+create index if not exists stock_snapshots_branch_idx on stock_snapshots (branch_id, product_id, taken_at desc);
+
+-- Retire the single-location stock columns and everything built on them.
+drop view if exists low_stock_products;
+drop index if exists products_low_stock_idx;
+drop function if exists apply_stock_movements(jsonb);
+drop function if exists set_min_stock_levels(jsonb);
+drop function if exists take_stock_snapshot();
+drop function if exists compact_stock_ledger(integer);
+drop function if exists sales_series(date, date, text, text);
+drop function if exists top_products(date, date, integer, text);
+drop function if exists daily_product_units(date, date, text);
+alter table products drop column if exists current_stock;
+alter table products drop column if exists min_stock_level;
+
+-- Catalog rows as a branch sees them. synced_at covers both catalog and stock edits.
+create or replace view branch_products as
+select p.*,
+       b.id as branch_id,
+       coalesce(bs.current_stock, 0) as current_stock,
+       bs.min_stock_level,
+       greatest(p.updated_at, bs.updated_at) as synced_at
+from products p
+cross join branches b
+left join branch_stock bs on bs.branch_id = b.id and bs.product_id = p.id;
+
+create or replace view low_stock_products as
+select bs.branch_id, p.id, p.name, bs.current_stock, bs.min_stock_level
+from branch_stock bs
+join products p on p.id = bs.product_id
+where bs.current_stock <= bs.min_stock_level;
+
+create or replace view sales_ledger as
+select si.id as line_id,
+       s.created_at,
+       s.id as sale_id,
+       s.customer_phone,
+       s.payment_mode,
+       p.name as product_name,
+       si.quantity,
+       si.price_at_sale,
+       si.quantity * si.price_at_sale as line_total,
+       p.cost_price,
+       s.branch_id
+from sale_items si
+join sales s on s.id = si.sale_id
+left join products p on p.id = si.product_id;
+
+-- Registers a branch with its own stock partition and a copy of branch 1's settings.
+create or replace function add_branch(p_id integer, p_name text)
+returns void
+language plpgsql
+as $$
+begin
+    insert into branches (id, name) values (p_id, p_name);
+    execute format('create table branch_stock_%s partition of branch_stock for values in (%s)', p_id, p_id);
+    insert into shop_settings (shop_name, shop_address, shop_contact, upi_id, tax_percent, branch_id)
+    select shop_name, shop_address, shop_contact, upi_id, tax_percent, p_id
+    from shop_settings where branch_id = 1;
+end;
+$$;
+
+-- Branch rows whose catalog entry or stock changed since `since` (all rows when null).
+create or replace function branch_products_since(p_branch integer, since timestamptz default null)
+returns setof branch_products
+language sql
+stable
+as $$
+    select * from branch_products
+    where branch_id = p_branch
+      and (since is null or id in (
+          select id from products where updated_at >= since
+          union
+          select product_id from branch_stock where branch_id = p_branch and updated_at >= since
+      ))
+    order by synced_at, id;
+$$;
+
+-- Appends a batch of movements ({branch_id, product_id, delta, reason, ref_id})
+-- and shifts branch stock in the same transaction. Returns the updated rows.
+create or replace function apply_stock_movements(movements jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+begin
+    with m as (
+        insert into stock_movements (branch_id, product_id, delta, reason, ref_id)
+        select coalesce((x->>'branch_id')::integer, 1),
+               (x->>'product_id')::uuid,
+               (x->>'delta')::integer,
+               x->>'reason',
+               nullif(x->>'ref_id', '')::uuid
+        from jsonb_array_elements(movements) as x
+        returning branch_id, product_id, delta
+    )
+    insert into branch_stock (branch_id, product_id, current_stock)
+    select branch_id, product_id, sum(delta) from m group by 1, 2
+    on conflict (branch_id, product_id) do update
+    set current_stock = branch_stock.current_stock + excluded.current_stock;
+
+    return query
+    select bp.* from branch_products bp
+    join (
+        select distinct coalesce((x->>'branch_id')::integer, 1) as branch_id, (x->>'product_id')::uuid as product_id
+        from jsonb_array_elements(movements) as x
+    ) t on bp.branch_id = t.branch_id and bp.id = t.product_id;
+end;
+$$;
+
+-- Moves stock between branches atomically. items: [{product_id, quantity}, ...].
+-- The whole transfer is refused if the source is short on any line.
+create or replace function transfer_stock(p_from integer, p_to integer, items jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    transfer_id uuid := gen_random_uuid();
+    short text;
+begin
+    if p_from = p_to then
+        raise exception 'Source and destination branch are the same';
+    end if;
+
+    perform 1 from branch_stock
+    where branch_id = p_from
+      and product_id in (select (x->>'product_id')::uuid from jsonb_array_elements(items) as x)
+    order by product_id
+    for update;
+
+    select string_agg(p.name, ', ') into short
+    from jsonb_array_elements(items) as x
+    join products p on p.id = (x->>'product_id')::uuid
+    left join branch_stock bs on bs.branch_id = p_from and bs.product_id = p.id
+    where coalesce(bs.current_stock, 0) < (x->>'quantity')::integer;
+    if short is not null then
+        raise exception 'Insufficient stock at source branch: %', short;
+    end if;
+
+    return query
+    select * from apply_stock_movements((
+        select jsonb_agg(m) from (
+            select jsonb_build_object('branch_id', p_from, 'product_id', x->>'product_id',
+                                      'delta', -(x->>'quantity')::integer,
+                                      'reason', 'transfer_out', 'ref_id', transfer_id) as m
+            from jsonb_array_elements(items) as x
+            union all
+            select jsonb_build_object('branch_id', p_to, 'product_id', x->>'product_id',
+                                      'delta', (x->>'quantity')::integer,
+                                      'reason', 'transfer_in', 'ref_id', transfer_id)
+            from jsonb_array_elements(items) as x
+        ) as moves
+    ));
+end;
+$$;
+
+-- Batch update of a branch's alert levels from {"<product id>": level, ...}.
+create or replace function set_min_stock_levels(p_branch integer, levels jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+begin
+    insert into branch_stock (branch_id, product_id, min_stock_level)
+    select p_branch, l.key::uuid, (l.value)::integer
+    from jsonb_each_text(levels) as l
+    on conflict (branch_id, product_id) do update
+    set min_stock_level = excluded.min_stock_level;
+
+    return query
+    select * from branch_products
+    where branch_id = p_branch
+      and id in (select key::uuid from jsonb_object_keys(levels) as key);
+end;
+$$;
+
+create or replace function take_stock_snapshot(p_branch integer)
+returns bigint
+language plpgsql
+as $$
+declare
+    watermark bigint;
+begin
+    lock table stock_movements in share mode;
+    select coalesce(max(id), 0) into watermark from stock_movements;
+    insert into stock_snapshots (branch_id, product_id, stock, last_movement_id)
+    select branch_id, product_id, current_stock, watermark
+    from branch_stock where branch_id = p_branch;
+    return watermark;
+end;
+$$;
+
+create or replace function compact_stock_ledger(p_branch integer, keep_days integer default 90)
+returns integer
+language plpgsql
+as $$
+declare
+    cutoff timestamptz := now() - make_interval(days => keep_days);
+    floor_id bigint;
+    removed integer;
+begin
+    select max(last_movement_id) into floor_id
+    from stock_snapshots where branch_id = p_branch and taken_at <= cutoff;
+    if floor_id is null then
+        return 0;
+    end if;
+
+    delete from stock_movements where branch_id = p_branch and id <= floor_id;
+    get diagnostics removed = row_count;
+
+    delete from stock_snapshots s
+    where s.branch_id = p_branch
+      and s.taken_at <= cutoff
+      and s.id not in (
+          select distinct on (product_id, date_trunc('month', taken_at)) id
+          from stock_snapshots
+          where branch_id = p_branch and taken_at <= cutoff
+          order by product_id, date_trunc('month', taken_at), taken_at desc
+      );
+
+    return removed;
+end;
+$$;
+
+-- Analytics, scoped to one branch (or every branch when p_branch is null).
+create or replace function sales_series(
+    start_date date,
+    end_date date,
+    bucket text default 'day',
+    tz text default 'Asia/Kolkata',
+    p_branch integer default null
+)
+returns table (period date, revenue numeric, profit numeric, units bigint)
+language sql
+stable
+as $$
+    select date_trunc(bucket, s.created_at at time zone tz)::date as period,
+           sum(si.quantity * si.price_at_sale) as revenue,
+           sum(si.quantity * (si.price_at_sale - coalesce(p.cost_price, 0))) as profit,
+           sum(si.quantity) as units
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    left join products p on p.id = si.product_id
+    where s.created_at >= (start_date::timestamp at time zone tz)
+      and s.created_at < ((end_date + 1)::timestamp at time zone tz)
+      and (p_branch is null or s.branch_id = p_branch)
+    group by 1
+    order by 1;
+$$;
+
+create or replace function top_products(
+    start_date date,
+    end_date date,
+    max_rows integer default 8,
+    tz text default 'Asia/Kolkata',
+    p_branch integer default null
+)
+returns table (product_name text, units bigint)
+language sql
+stable
+as $$
+    select coalesce(p.name, 'Unknown') as product_name,
+           sum(si.quantity) as units
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    left join products p on p.id = si.product_id
+    where s.created_at >= (start_date::timestamp at time zone tz)
+      and s.created_at < ((end_date + 1)::timestamp at time zone tz)
+      and (p_branch is null or s.branch_id = p_branch)
+    group by 1
+    order by 2 desc
+    limit max_rows;
+$$;
+
+create or replace function daily_product_units(
+    start_date date,
+    end_date date,
+    tz text default 'Asia/Kolkata',
+    p_branch integer default null
+)
+returns table (product_id uuid, day date, units bigint)
+language sql
+stable
+as $$
+    select si.product_id,
+           (s.created_at at time zone tz)::date as day,
+           sum(si.quantity) as units
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    where s.created_at >= (start_date::timestamp at time zone tz)
+      and s.created_at < ((end_date + 1)::timestamp at time zone tz)
+      and (p_branch is null or s.branch_id = p_branch)
+    group by 1, 2
+    order by 1, 2;
+$$;
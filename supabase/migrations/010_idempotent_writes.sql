@@ -0,0 +1,142 @@
+-- Transactional, idempotent sale creation, voids and transfers, so the app can
+-- safely retry them after a timeout or a double-click.
+
+alter table sales add column if not exists idempotency_key uuid;
+create unique index if not exists sales_idempotency_key_idx on sales (idempotency_key);
+
+-- Creates the sale, its items, the stock movements and the customer stats in one
+-- transaction. Replaying the same key returns the original sale instead of a copy.
+-- Returns {"sale_id": ..., "products": [updated branch_products rows]}.
+create or replace function create_sale(
+    p_key uuid,
+    p_branch integer,
+    p_phone text,
+    p_total numeric,
+    p_payment text,
+    p_items jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_sale sales;
+begin
+    insert into sales (customer_phone, total_amount, payment_mode, branch_id, idempotency_key)
+    values (p_phone, p_total, p_payment, p_branch, p_key)
+    on conflict (idempotency_key) do nothing
+    returning * into v_sale;
+
+    if v_sale.id is null then
+        select * into v_sale from sales where idempotency_key = p_key;
+    else
+        insert into sale_items (sale_id, product_id, quantity, price_at_sale)
+        select v_sale.id, (x->>'product_id')::uuid, (x->>'quantity')::integer, (x->>'price_at_sale')::numeric
+        from jsonb_array_elements(p_items) as x;
+
+        perform apply_stock_movements((
+            select jsonb_agg(jsonb_build_object(
+                'branch_id', p_branch, 'product_id', x->>'product_id',
+                'delta', -(x->>'quantity')::integer, 'reason', 'sale', 'ref_id', v_sale.id))
+            from jsonb_array_elements(p_items) as x
+        ));
+
+        if coalesce(p_phone, '') <> '' then
+            perform record_customer_sale(p_phone, p_total, v_sale.created_at);
+        end if;
+    end if;
+
+    return jsonb_build_object(
+        'sale_id', v_sale.id,
+        'products', coalesce((
+            select jsonb_agg(to_jsonb(bp)) from branch_products bp
+            where bp.branch_id = v_sale.branch_id
+              and bp.id in (select product_id from sale_items where sale_id = v_sale.id)
+        ), '[]'::jsonb)
+    );
+end;
+$$;
+
+-- Restores stock, reverses customer stats and deletes the sale in one transaction.
+-- Voiding a sale that is already gone is a no-op. Returns updated branch_products rows.
+create or replace function void_sale(p_sale_id uuid)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    v_sale sales;
+begin
+    select * into v_sale from sales where id = p_sale_id for update;
+    if not found then
+        return;
+    end if;
+
+    return query
+    select * from apply_stock_movements((
+        select jsonb_agg(jsonb_build_object(
+            'branch_id', v_sale.branch_id, 'product_id', si.product_id,
+            'delta', si.quantity, 'reason', 'void', 'ref_id', v_sale.id))
+        from sale_items si where si.sale_id = v_sale.id
+    ));
+
+    delete from sales where id = v_sale.id;
+
+    if coalesce(v_sale.customer_phone, '') <> '' then
+        perform reverse_customer_sale(v_sale.customer_phone, v_sale.total_amount);
+    end if;
+end;
+$$;
+
+-- Transfers keyed by p_key: a replay finds the earlier movements and does nothing.
+drop function if exists transfer_stock(integer, integer, jsonb);
+create or replace function transfer_stock(p_from integer, p_to integer, items jsonb, p_key uuid)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    short text;
+begin
+    if p_from = p_to then
+        raise exception 'Source and destination branch are the same';
+    end if;
+
+    perform 1 from branch_stock
+    where branch_id = p_from
+      and product_id in (select (x->>'product_id')::uuid from jsonb_array_elements(items) as x)
+    order by product_id
+    for update;
+
+    if exists (select 1 from stock_movements where ref_id = p_key and reason = 'transfer_out') then
+        return query
+        select * from branch_products
+        where branch_id in (p_from, p_to)
+          and id in (select (x->>'product_id')::uuid from jsonb_array_elements(items) as x);
+        return;
+    end if;
+
+    select string_agg(p.name, ', ') into short
+    from jsonb_array_elements(items) as x
+    join products p on p.id = (x->>'product_id')::uuid
+    left join branch_stock bs on bs.branch_id = p_from and bs.product_id = p.id
+    where coalesce(bs.current_stock, 0) < (x->>'quantity')::integer;
+    if short is not null then
+        raise exception 'Insufficient stock at source branch: %', short;
+    end if;
+
+    return query
+    select * from apply_stock_movements((
+        select jsonb_agg(m) from (
+            select jsonb_build_object('branch_id', p_from, 'product_id', x->>'product_id',
+                                      'delta', -(x->>'quantity')::integer,
+                                      'reason', 'transfer_out', 'ref_id', p_key) as m
+            from jsonb_array_elements(items) as x
+            union all
+            select jsonb_build_object('branch_id', p_to, 'product_id', x->>'product_id',
+                                      'delta', (x->>'quantity')::integer,
+                                      'reason', 'transfer_in', 'ref_id', p_key)
+            from jsonb_array_elements(items) as x
+        ) as moves
+    ));
+end;
+$$;
+
+create index if not exists stock_movements_ref_idx on stock_movements (ref_id) where ref_id is not null;
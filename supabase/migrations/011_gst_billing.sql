@@ -0,0 +1,245 @@
+-- GST billing: HSN code and rate per product, the tax breakup stored on every sale
+-- and sale line, and create_sale accepting the computed bill.
+
+alter table products add column if not exists hsn_code text;
+alter table products add column if not exists gst_rate numeric(5, 2);
+
+alter table shop_settings add column if not exists gstin text;
+alter table shop_settings add column if not exists prices_include_tax boolean not null default true;
+
+alter table sales add column if not exists discount_amount numeric(12, 2) not null default 0;
+alter table sales add column if not exists taxable_amount numeric(12, 2);
+alter table sales add column if not exists cgst_amount numeric(12, 2) not null default 0;
+alter table sales add column if not exists sgst_amount numeric(12, 2) not null default 0;
+alter table sales add column if not exists round_off numeric(6, 2) not null default 0;
+
+alter table sale_items add column if not exists hsn_code text;
+alter table sale_items add column if not exists gst_rate numeric(5, 2);
+alter table sale_items add column if not exists discount_percent numeric(5, 2) not null default 0;
+alter table sale_items add column if not exists taxable_value numeric(12, 2);
+alter table sale_items add column if not exists cgst_amount numeric(12, 2) not null default 0;
+alter table sale_items add column if not exists sgst_amount numeric(12, 2) not null default 0;
+
+-- branch_products expands p.* when it is created, so it is rebuilt to pick up the new
+-- product columns. The functions returning its row type go with it and are recreated
+-- unchanged below.
+drop view if exists branch_products cascade;
+
+create view branch_products as
+select p.*,
+       b.id as branch_id,
+       coalesce(bs.current_stock, 0) as current_stock,
+       bs.min_stock_level,
+       greatest(p.updated_at, bs.updated_at) as synced_at
+from products p
+cross join branches b
+left join branch_stock bs on bs.branch_id = b.id and bs.product_id = p.id;
+
+create or replace function branch_products_since(p_branch integer, since timestamptz default null)
+returns setof branch_products
+language sql
+stable
+as $$
+    select * from branch_products
+    where branch_id = p_branch
+      and (since is null or id in (
+          select id from products where updated_at >= since
+          union
+          select product_id from branch_stock where branch_id = p_branch and updated_at >= since
+      ))
+    order by synced_at, id;
+$$;
+
+create or replace function apply_stock_movements(movements jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+begin
+    with m as (
+        insert into stock_movements (branch_id, product_id, delta, reason, ref_id)
+        select coalesce((x->>'branch_id')::integer, 1),
+               (x->>'product_id')::uuid,
+               (x->>'delta')::integer,
+               x->>'reason',
+               nullif(x->>'ref_id', '')::uuid
+        from jsonb_array_elements(movements) as x
+        returning branch_id, product_id, delta
+    )
+    insert into branch_stock (branch_id, product_id, current_stock)
+    select branch_id, product_id, sum(delta) from m group by 1, 2
+    on conflict (branch_id, product_id) do update
+    set current_stock = branch_stock.current_stock + excluded.current_stock;
+
+    return query
+    select bp.* from branch_products bp
+    join (
+        select distinct coalesce((x->>'branch_id')::integer, 1) as branch_id, (x->>'product_id')::uuid as product_id
+        from jsonb_array_elements(movements) as x
+    ) t on bp.branch_id = t.branch_id and bp.id = t.product_id;
+end;
+$$;
+
+create or replace function set_min_stock_levels(p_branch integer, levels jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+begin
+    insert into branch_stock (branch_id, product_id, min_stock_level)
+    select p_branch, l.key::uuid, (l.value)::integer
+    from jsonb_each_text(levels) as l
+    on conflict (branch_id, product_id) do update
+    set min_stock_level = excluded.min_stock_level;
+
+    return query
+    select * from branch_products
+    where branch_id = p_branch
+      and id in (select key::uuid from jsonb_object_keys(levels) as key);
+end;
+$$;
+
+create or replace function void_sale(p_sale_id uuid)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    v_sale sales;
+begin
+    select * into v_sale from sales where id = p_sale_id for update;
+    if not found then
+        return;
+    end if;
+
+    return query
+    select * from apply_stock_movements((
+        select jsonb_agg(jsonb_build_object(
+            'branch_id', v_sale.branch_id, 'product_id', si.product_id,
+            'delta', si.quantity, 'reason', 'void', 'ref_id', v_sale.id))
+        from sale_items si where si.sale_id = v_sale.id
+    ));
+
+    delete from sales where id = v_sale.id;
+
+    if coalesce(v_sale.customer_phone, '') <> '' then
+        perform reverse_customer_sale(v_sale.customer_phone, v_sale.total_amount);
+    end if;
+end;
+$$;
+
+create or replace function transfer_stock(p_from integer, p_to integer, items jsonb, p_key uuid)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    short text;
+begin
+    if p_from = p_to then
+        raise exception 'Source and destination branch are the same';
+    end if;
+
+    perform 1 from branch_stock
+    where branch_id = p_from
+      and product_id in (select (x->>'product_id')::uuid from jsonb_array_elements(items) as x)
+    order by product_id
+    for update;
+
+    if exists (select 1 from stock_movements where ref_id = p_key and reason = 'transfer_out') then
+        return query
+        select * from branch_products
+        where branch_id in (p_from, p_to)
+          and id in (select (x->>'product_id')::uuid from jsonb_array_elements(items) as x);
+        return;
+    end if;
+
+    select string_agg(p.name, ', ') into short
+    from jsonb_array_elements(items) as x
+    join products p on p.id = (x->>'product_id')::uuid
+    left join branch_stock bs on bs.branch_id = p_from and bs.product_id = p.id
+    where coalesce(bs.current_stock, 0) < (x->>'quantity')::integer;
+    if short is not null then
+        raise exception 'Insufficient stock at source branch: %', short;
+    end if;
+
+    return query
+    select * from apply_stock_movements((
+        select jsonb_agg(m) from (
+            select jsonb_build_object('branch_id', p_from, 'product_id', x->>'product_id',
+                                      'delta', -(x->>'quantity')::integer,
+                                      'reason', 'transfer_out', 'ref_id', p_key) as m
+            from jsonb_array_elements(items) as x
+            union all
+            select jsonb_build_object('branch_id', p_to, 'product_id', x->>'product_id',
+                                      'delta', (x->>'quantity')::integer,
+                                      'reason', 'transfer_in', 'ref_id', p_key)
+            from jsonb_array_elements(items) as x
+        ) as moves
+    ));
+end;
+$$;
+
+-- Same contract as before, plus p_summary: the bill totals in rupees
+-- ({discount, taxable, cgst, sgst, round_off}). Items may carry hsn_code, gst_rate,
+-- discount_percent, taxable_value, cgst_amount and sgst_amount.
+drop function if exists create_sale(uuid, integer, text, numeric, text, jsonb);
+
+create or replace function create_sale(
+    p_key uuid,
+    p_branch integer,
+    p_phone text,
+    p_total numeric,
+    p_payment text,
+    p_items jsonb,
+    p_summary jsonb default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_sale sales;
+begin
+    insert into sales (customer_phone, total_amount, payment_mode, branch_id, idempotency_key,
+                       discount_amount, taxable_amount, cgst_amount, sgst_amount, round_off)
+    values (p_phone, p_total, p_payment, p_branch, p_key,
+            coalesce((p_summary->>'discount')::numeric, 0),
+            (p_summary->>'taxable')::numeric,
+            coalesce((p_summary->>'cgst')::numeric, 0),
+            coalesce((p_summary->>'sgst')::numeric, 0),
+            coalesce((p_summary->>'round_off')::numeric, 0))
+    on conflict (idempotency_key) do nothing
+    returning * into v_sale;
+
+    if v_sale.id is null then
+        select * into v_sale from sales where idempotency_key = p_key;
+    else
+        insert into sale_items (sale_id, product_id, quantity, price_at_sale, hsn_code, gst_rate,
+                                discount_percent, taxable_value, cgst_amount, sgst_amount)
+        select v_sale.id, (x->>'product_id')::uuid, (x->>'quantity')::integer, (x->>'price_at_sale')::numeric,
+               nullif(x->>'hsn_code', ''),
+               (x->>'gst_rate')::numeric,
+               coalesce((x->>'discount_percent')::numeric, 0),
+               (x->>'taxable_value')::numeric,
+               coalesce((x->>'cgst_amount')::numeric, 0),
+               coalesce((x->>'sgst_amount')::numeric, 0)
+        from jsonb_array_elements(p_items) as x;
+
+        perform apply_stock_movements((
+            select jsonb_agg(jsonb_build_object(
+                'branch_id', p_branch, 'product_id', x->>'product_id',
+                'delta', -(x->>'quantity')::integer, 'reason', 'sale', 'ref_id', v_sale.id))
+            from jsonb_array_elements(p_items) as x
+        ));
+
+        if coalesce(p_phone, '') <> '' then
+            perform record_customer_sale(p_phone, p_total, v_sale.created_at);
+        end if;
+    end if;
+
+    return jsonb_build_object(
+        'sale_id', v_sale.id,
+        'products', coalesce((
+            select jsonb_agg(to_jsonb(bp)) from branch_products bp
+            where bp.branch_id = v_sale.branch_id
+              and bp.id in (select product_id from sale_items where sale_id = v_sale.id)
+        ), '[]'::jsonb)
+    );
+end;
+$$;
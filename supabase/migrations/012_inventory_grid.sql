@@ -0,0 +1,59 @@
+-- Server-side inventory grid: the name search, category filter, sort and paging all
+-- run in Postgres against branch_products, so only the visible page is sent back.
+
+create extension if not exists pg_trgm;
+
+-- Substring name search (ilike '%term%') uses the trigram index
+create index if not exists products_name_trgm_idx on products using gin (name gin_trgm_ops);
+
+-- Ordered paging per sort column; id breaks ties so page boundaries are stable
+create index if not exists products_name_id_idx on products (name, id);
+create index if not exists products_category_id_idx on products (category, id);
+create index if not exists products_category_name_idx on products (category, name, id);  -- category filter + name sort
+create index if not exists products_selling_price_id_idx on products (selling_price, id);
+create index if not exists products_sku_id_idx on products (sku, id);
+create index if not exists branch_stock_current_stock_idx on branch_stock (branch_id, current_stock, product_id);
+
+-- Every product gets a branch_stock row in every branch (new products via the
+-- trigger below, new branches in add_branch). branch_products can then inner-join
+-- and expose bs.current_stock itself. The old coalesce over a left join could not
+-- use the index above for the stock sort.
+insert into branch_stock (branch_id, product_id)
+select b.id, p.id from branches b cross join products p
+on conflict do nothing;
+
+create or replace function seed_branch_stock()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into branch_stock (branch_id, product_id)
+    select id, new.id from branches
+    on conflict do nothing;
+    return new;
+end;
+$$;
+
+drop trigger if exists products_seed_branch_stock on products;
+create trigger products_seed_branch_stock
+    after insert on products
+    for each row execute function seed_branch_stock();
+
+create or replace view branch_products as
+select p.*,
+       bs.branch_id,
+       bs.current_stock,
+       bs.min_stock_level,
+       greatest(p.updated_at, bs.updated_at) as synced_at
+from products p
+join branch_stock bs on bs.product_id = p.id;
+
+create or replace function product_categories()
+returns table (category text)
+language sql
+stable
+as $$
+    select distinct p.category from products p
+    where coalesce(p.category, '') <> ''
+    order by 1;
+$$;
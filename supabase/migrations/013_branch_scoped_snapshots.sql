@@ -0,0 +1,103 @@
+-- Stock snapshots lock only their own branch. take_stock_snapshot used to take a
+-- share lock on the whole stock_movements table, which stalled sales at every
+-- branch. Writers now hold a shared per-branch advisory lock until commit. A
+-- snapshot takes the same lock exclusively, so it waits only for that branch's
+-- in-flight writes. Its watermark and stock totals then agree.
+
+create or replace function apply_stock_movements(movements jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+begin
+    perform pg_advisory_xact_lock_shared(hashtext('stock_ledger'), b.branch_id)
+    from (
+        select distinct coalesce((x->>'branch_id')::integer, 1) as branch_id
+        from jsonb_array_elements(movements) as x
+        order by 1
+    ) b;
+
+    with m as (
+        insert into stock_movements (branch_id, product_id, delta, reason, ref_id)
+        select coalesce((x->>'branch_id')::integer, 1),
+               (x->>'product_id')::uuid,
+               (x->>'delta')::integer,
+               x->>'reason',
+               nullif(x->>'ref_id', '')::uuid
+        from jsonb_array_elements(movements) as x
+        returning branch_id, product_id, delta
+    )
+    insert into branch_stock (branch_id, product_id, current_stock)
+    select branch_id, product_id, sum(delta) from m group by 1, 2
+    on conflict (branch_id, product_id) do update
+    set current_stock = branch_stock.current_stock + excluded.current_stock;
+
+    return query
+    select bp.* from branch_products bp
+    join (
+        select distinct coalesce((x->>'branch_id')::integer, 1) as branch_id, (x->>'product_id')::uuid as product_id
+        from jsonb_array_elements(movements) as x
+    ) t on bp.branch_id = t.branch_id and bp.id = t.product_id;
+end;
+$$;
+
+-- The watermark is this branch's newest movement. Reads filter movements by branch,
+-- so other branches' ids do not matter.
+create or replace function take_stock_snapshot(p_branch integer)
+returns bigint
+language plpgsql
+as $$
+declare
+    watermark bigint;
+begin
+    perform pg_advisory_xact_lock(hashtext('stock_ledger'), p_branch);
+    select coalesce(max(id), 0) into watermark from stock_movements where branch_id = p_branch;
+    insert into stock_snapshots (branch_id, product_id, stock, last_movement_id)
+    select branch_id, product_id, current_stock, watermark
+    from branch_stock where branch_id = p_branch;
+    return watermark;
+end;
+$$;
+
+-- Records how far each branch's ledger has been compacted. Point-in-time reads at
+-- or before compacted_before only have month-end snapshots to go on.
+create table if not exists stock_ledger_compactions (
+    branch_id integer primary key references branches(id),
+    compacted_before timestamptz not null
+);
+
+create or replace function compact_stock_ledger(p_branch integer, keep_days integer default 90)
+returns integer
+language plpgsql
+as $$
+declare
+    cutoff timestamptz := now() - make_interval(days => keep_days);
+    floor_id bigint;
+    removed integer;
+begin
+    select max(last_movement_id) into floor_id
+    from stock_snapshots where branch_id = p_branch and taken_at <= cutoff;
+    if floor_id is null then
+        return 0;
+    end if;
+
+    delete from stock_movements where branch_id = p_branch and id <= floor_id;
+    get diagnostics removed = row_count;
+
+    delete from stock_snapshots s
+    where s.branch_id = p_branch
+      and s.taken_at <= cutoff
+      and s.id not in (
+          select distinct on (product_id, date_trunc('month', taken_at)) id
+          from stock_snapshots
+          where branch_id = p_branch and taken_at <= cutoff
+          order by product_id, date_trunc('month', taken_at), taken_at desc
+      );
+
+    insert into stock_ledger_compactions (branch_id, compacted_before)
+    values (p_branch, cutoff)
+    on conflict (branch_id) do update
+    set compacted_before = greatest(stock_ledger_compactions.compacted_before, excluded.compacted_before);
+
+    return removed;
+end;
+$$;
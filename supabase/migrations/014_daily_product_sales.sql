@@ -0,0 +1,140 @@
+-- Daily units per product and branch, kept up to date by create_sale and void_sale,
+-- so the reorder forecast reads a small rollup instead of re-aggregating two years
+-- of sale_items for every page. Days are shop-local (Asia/Kolkata, as SHOP_TZ in
+-- src/analytics.py).
+
+create table if not exists daily_product_sales (
+    branch_id integer not null references branches(id),
+    product_id uuid not null references products(id) on delete cascade,
+    day date not null,
+    units bigint not null,
+    primary key (branch_id, product_id, day)
+);
+
+insert into daily_product_sales (branch_id, product_id, day, units)
+select s.branch_id, si.product_id, (s.created_at at time zone 'Asia/Kolkata')::date, sum(si.quantity)
+from sales s
+join sale_items si on si.sale_id = s.id
+group by 1, 2, 3
+on conflict (branch_id, product_id, day) do update set units = excluded.units;
+
+-- Adds (p_sign = 1) or removes (p_sign = -1) one sale's lines from the rollup.
+create or replace function roll_up_sale(p_sale_id uuid, p_sign integer)
+returns void
+language plpgsql
+as $$
+begin
+    insert into daily_product_sales as d (branch_id, product_id, day, units)
+    select s.branch_id, si.product_id, (s.created_at at time zone 'Asia/Kolkata')::date, p_sign * sum(si.quantity)
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    where s.id = p_sale_id
+    group by 1, 2, 3
+    on conflict (branch_id, product_id, day) do update
+    set units = d.units + excluded.units;
+
+    delete from daily_product_sales d
+    using sales s
+    where s.id = p_sale_id
+      and d.branch_id = s.branch_id
+      and d.day = (s.created_at at time zone 'Asia/Kolkata')::date
+      and d.units = 0;
+end;
+$$;
+
+-- Superseded by reading daily_product_sales directly (see src/forecast.py)
+drop function if exists daily_product_units(date, date, text, integer);
+
+create or replace function create_sale(
+    p_key uuid,
+    p_branch integer,
+    p_phone text,
+    p_total numeric,
+    p_payment text,
+    p_items jsonb,
+    p_summary jsonb default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_sale sales;
+begin
+    insert into sales (customer_phone, total_amount, payment_mode, branch_id, idempotency_key,
+                       discount_amount, taxable_amount, cgst_amount, sgst_amount, round_off)
+    values (p_phone, p_total, p_payment, p_branch, p_key,
+            coalesce((p_summary->>'discount')::numeric, 0),
+            (p_summary->>'taxable')::numeric,
+            coalesce((p_summary->>'cgst')::numeric, 0),
+            coalesce((p_summary->>'sgst')::numeric, 0),
+            coalesce((p_summary->>'round_off')::numeric, 0))
+    on conflict (idempotency_key) do nothing
+    returning * into v_sale;
+
+    if v_sale.id is null then
+        select * into v_sale from sales where idempotency_key = p_key;
+    else
+        insert into sale_items (sale_id, product_id, quantity, price_at_sale, hsn_code, gst_rate,
+                                discount_percent, taxable_value, cgst_amount, sgst_amount)
+        select v_sale.id, (x->>'product_id')::uuid, (x->>'quantity')::integer, (x->>'price_at_sale')::numeric,
+               nullif(x->>'hsn_code', ''),
+               (x->>'gst_rate')::numeric,
+               coalesce((x->>'discount_percent')::numeric, 0),
+               (x->>'taxable_value')::numeric,
+               coalesce((x->>'cgst_amount')::numeric, 0),
+               coalesce((x->>'sgst_amount')::numeric, 0)
+        from jsonb_array_elements(p_items) as x;
+
+        perform apply_stock_movements((
+            select jsonb_agg(jsonb_build_object(
+                'branch_id', p_branch, 'product_id', x->>'product_id',
+                'delta', -(x->>'quantity')::integer, 'reason', 'sale', 'ref_id', v_sale.id))
+            from jsonb_array_elements(p_items) as x
+        ));
+
+        perform roll_up_sale(v_sale.id, 1);
+
+        if coalesce(p_phone, '') <> '' then
+            perform record_customer_sale(p_phone, p_total, v_sale.created_at);
+        end if;
+    end if;
+
+    return jsonb_build_object(
+        'sale_id', v_sale.id,
+        'products', coalesce((
+            select jsonb_agg(to_jsonb(bp)) from branch_products bp
+            where bp.branch_id = v_sale.branch_id
+              and bp.id in (select product_id from sale_items where sale_id = v_sale.id)
+        ), '[]'::jsonb)
+    );
+end;
+$$;
+
+create or replace function void_sale(p_sale_id uuid)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    v_sale sales;
+begin
+    select * into v_sale from sales where id = p_sale_id for update;
+    if not found then
+        return;
+    end if;
+
+    return query
+    select * from apply_stock_movements((
+        select jsonb_agg(jsonb_build_object(
+            'branch_id', v_sale.branch_id, 'product_id', si.product_id,
+            'delta', si.quantity, 'reason', 'void', 'ref_id', v_sale.id))
+        from sale_items si where si.sale_id = v_sale.id
+    ));
+
+    perform roll_up_sale(v_sale.id, -1);
+    delete from sales where id = v_sale.id;
+
+    if coalesce(v_sale.customer_phone, '') <> '' then
+        perform reverse_customer_sale(v_sale.customer_phone, v_sale.total_amount);
+    end if;
+end;
+$$;
@@ -0,0 +1,64 @@
+-- transfer_stock rejects zero or negative quantities, and sums repeated lines for
+-- one product before checking the source branch's stock. A negative line used to
+-- move stock backwards unchecked, and split lines could each pass the check while
+-- together overdrawing the source.
+
+create or replace function transfer_stock(p_from integer, p_to integer, items jsonb, p_key uuid)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    short text;
+begin
+    if p_from = p_to then
+        raise exception 'Source and destination branch are the same';
+    end if;
+    if exists (select 1 from jsonb_array_elements(items) as x
+               where coalesce((x->>'quantity')::integer, 0) <= 0) then
+        raise exception 'Transfer quantities must be positive';
+    end if;
+
+    perform 1 from branch_stock
+    where branch_id = p_from
+      and product_id in (select (x->>'product_id')::uuid from jsonb_array_elements(items) as x)
+    order by product_id
+    for update;
+
+    if exists (select 1 from stock_movements where ref_id = p_key and reason = 'transfer_out') then
+        return query
+        select * from branch_products
+        where branch_id in (p_from, p_to)
+          and id in (select (x->>'product_id')::uuid from jsonb_array_elements(items) as x);
+        return;
+    end if;
+
+    -- Lines for the same product are summed before checking the source's stock
+    select string_agg(p.name, ', ') into short
+    from (
+        select (x->>'product_id')::uuid as product_id, sum((x->>'quantity')::integer) as quantity
+        from jsonb_array_elements(items) as x
+        group by 1
+    ) t
+    join products p on p.id = t.product_id
+    left join branch_stock bs on bs.branch_id = p_from and bs.product_id = p.id
+    where coalesce(bs.current_stock, 0) < t.quantity;
+    if short is not null then
+        raise exception 'Insufficient stock at source branch: %', short;
+    end if;
+
+    return query
+    select * from apply_stock_movements((
+        select jsonb_agg(m) from (
+            select jsonb_build_object('branch_id', p_from, 'product_id', x->>'product_id',
+                                      'delta', -(x->>'quantity')::integer,
+                                      'reason', 'transfer_out', 'ref_id', p_key) as m
+            from jsonb_array_elements(items) as x
+            union all
+            select jsonb_build_object('branch_id', p_to, 'product_id', x->>'product_id',
+                                      'delta', (x->>'quantity')::integer,
+                                      'reason', 'transfer_in', 'ref_id', p_key)
+            from jsonb_array_elements(items) as x
+        ) as moves
+    ));
+end;
+$$;
@@ -0,0 +1,17 @@
+-- New branches copy the GST settings added in 011 (gstin, prices_include_tax) from
+-- the main branch along with the rest of the shop profile.
+
+create or replace function add_branch(p_id integer, p_name text)
+returns void
+language plpgsql
+as $$
+begin
+    insert into branches (id, name) values (p_id, p_name);
+    execute format('create table branch_stock_%s partition of branch_stock for values in (%s)', p_id, p_id);
+    insert into branch_stock (branch_id, product_id) select p_id, id from products;  -- see 012
+    insert into shop_settings (shop_name, shop_address, shop_contact, upi_id, tax_percent, gstin,
+                               prices_include_tax, branch_id)
+    select shop_name, shop_address, shop_contact, upi_id, tax_percent, gstin, prices_include_tax, p_id
+    from shop_settings where branch_id = 1;
+end;
+$$;
@@ -0,0 +1,55 @@
+-- Reporting on the amounts actually billed. Since 011 a line can carry a discount,
+-- and its stored taxable_value and CGST/SGST are what the invoice shows. Revenue
+-- and the ledger's line_total are now the discounted, tax-inclusive line amount.
+-- Profit is taxable value less cost, because GST collected is not income. Lines
+-- from before 011 have no taxable_value and fall back to quantity * price.
+
+create or replace view sales_ledger as
+select si.id as line_id,
+       s.created_at,
+       s.id as sale_id,
+       s.customer_phone,
+       s.payment_mode,
+       p.name as product_name,
+       si.quantity,
+       si.price_at_sale,
+       coalesce(si.taxable_value + si.cgst_amount + si.sgst_amount,
+                si.quantity * si.price_at_sale * (1 - si.discount_percent / 100)) as line_total,
+       p.cost_price,
+       s.branch_id,
+       si.hsn_code,
+       si.gst_rate,
+       si.discount_percent,
+       si.taxable_value,
+       si.cgst_amount,
+       si.sgst_amount
+from sale_items si
+join sales s on s.id = si.sale_id
+left join products p on p.id = si.product_id;
+
+create or replace function sales_series(
+    start_date date,
+    end_date date,
+    bucket text default 'day',
+    tz text default 'Asia/Kolkata',
+    p_branch integer default null
+)
+returns table (period date, revenue numeric, profit numeric, units bigint)
+language sql
+stable
+as $$
+    select date_trunc(bucket, s.created_at at time zone tz)::date as period,
+           sum(coalesce(si.taxable_value + si.cgst_amount + si.sgst_amount,
+                        si.quantity * si.price_at_sale * (1 - si.discount_percent / 100))) as revenue,
+           sum(coalesce(si.taxable_value, si.quantity * si.price_at_sale * (1 - si.discount_percent / 100))
+               - si.quantity * coalesce(p.cost_price, 0)) as profit,
+           sum(si.quantity) as units
+    from sales s
+    join sale_items si on si.sale_id = s.id
+    left join products p on p.id = si.product_id
+    where s.created_at >= (start_date::timestamp at time zone tz)
+      and s.created_at < ((end_date + 1)::timestamp at time zone tz)
+      and (p_branch is null or s.branch_id = p_branch)
+    group by 1
+    order by 1;
+$$;
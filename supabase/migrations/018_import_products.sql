@@ -0,0 +1,49 @@
+-- Bulk import in one transaction: catalog rows, this branch's alert levels and the
+-- opening-stock 'import' movements commit together or not at all. A failed import
+-- leaves nothing behind to duplicate on the next attempt.
+
+create or replace function import_products(p_branch integer, p_rows jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    v_rows jsonb;
+begin
+    -- Ids are fixed up front so each row's stock and alert level follow its product
+    select coalesce(jsonb_agg(x || jsonb_build_object('id', gen_random_uuid())), '[]'::jsonb)
+    into v_rows
+    from jsonb_array_elements(p_rows) as x;
+
+    insert into products (id, name, category, sku, barcode, cost_price, selling_price, hsn_code, gst_rate)
+    select (x->>'id')::uuid,
+           x->>'name',
+           x->>'category',
+           nullif(x->>'sku', ''),
+           nullif(x->>'barcode', ''),
+           (x->>'cost_price')::numeric,
+           (x->>'selling_price')::numeric,
+           nullif(x->>'hsn_code', ''),
+           (x->>'gst_rate')::numeric
+    from jsonb_array_elements(v_rows) as x;
+
+    insert into branch_stock (branch_id, product_id, min_stock_level)
+    select p_branch, (x->>'id')::uuid, (x->>'min_stock_level')::numeric::integer
+    from jsonb_array_elements(v_rows) as x
+    where x->>'min_stock_level' is not null
+    on conflict (branch_id, product_id) do update
+    set min_stock_level = excluded.min_stock_level;
+
+    perform apply_stock_movements((
+        select jsonb_agg(jsonb_build_object(
+            'branch_id', p_branch, 'product_id', x->>'id',
+            'delta', (x->>'current_stock')::numeric::integer, 'reason', 'import'))
+        from jsonb_array_elements(v_rows) as x
+        where coalesce((x->>'current_stock')::numeric, 0) <> 0
+    ));
+
+    return query
+    select * from branch_products
+    where branch_id = p_branch
+      and id in (select (x->>'id')::uuid from jsonb_array_elements(v_rows) as x);
+end;
+$$;
@@ -0,0 +1,28 @@
+-- Catalog delta sync pages by keyset on (synced_at, id) instead of OFFSET. With
+-- OFFSET, a row whose synced_at moves mid-fetch shifts every later row back one
+-- place and the row at the page boundary is skipped.
+
+drop function if exists branch_products_since(integer, timestamptz);
+
+create or replace function branch_products_since(
+    p_branch integer,
+    since timestamptz default null,
+    after_ts timestamptz default null,
+    after_id uuid default null,
+    p_limit integer default 1000
+)
+returns setof branch_products
+language sql
+stable
+as $$
+    select * from branch_products
+    where branch_id = p_branch
+      and (since is null or id in (
+          select id from products where updated_at >= since
+          union
+          select product_id from branch_stock where branch_id = p_branch and updated_at >= since
+      ))
+      and (after_ts is null or (synced_at, id) > (after_ts, after_id))
+    order by synced_at, id
+    limit p_limit;
+$$;
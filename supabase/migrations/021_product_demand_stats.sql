@@ -0,0 +1,39 @@
+-- Reorder forecast inputs reduced in the database: one row per product with its
+-- exponentially weighted unit sums, recent-window and total units over the history
+-- window, instead of shipping every (product, day) row of the rollup to the app.
+-- Weights are alpha * (1 - alpha)^age with age 0 on p_end, as in src/forecast.py.
+-- Paged by product id (p_after) so each call is a range scan of the primary key.
+
+create or replace function product_demand_stats(
+    p_branch integer,
+    p_end date,
+    p_days integer,
+    p_alpha double precision,
+    p_recent_days integer,
+    p_after uuid default null,
+    p_limit integer default 1000
+)
+returns table (
+    product_id uuid,
+    ew_units double precision,
+    ew_sq_units double precision,
+    recent_units bigint,
+    total_units bigint
+)
+language sql
+stable
+as $$
+    select d.product_id,
+           sum(d.units * p_alpha * power(1 - p_alpha, p_end - d.day)),
+           sum(d.units::double precision ^ 2 * p_alpha * power(1 - p_alpha, p_end - d.day)),
+           coalesce(sum(d.units) filter (where p_end - d.day < p_recent_days), 0)::bigint,
+           sum(d.units)::bigint
+    from daily_product_sales d
+    where d.branch_id = p_branch
+      and d.day > p_end - p_days
+      and d.day <= p_end
+      and (p_after is null or d.product_id > p_after)
+    group by d.product_id
+    order by d.product_id
+    limit p_limit;
+$$;
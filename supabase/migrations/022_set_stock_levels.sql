@@ -0,0 +1,39 @@
+-- Stock counts typed into the inventory grid are saved in one call. Each product's
+-- branch_stock row is locked, the difference between the typed count and the
+-- current stock is booked as an 'adjust' movement, and all movements go in one
+-- batch. The count is read under the row lock, so a sale committed between the read
+-- and the write can no longer be overwritten.
+
+create or replace function set_stock_levels(p_branch integer, targets jsonb)
+returns setof branch_products
+language plpgsql
+as $$
+declare
+    moves jsonb;
+begin
+    perform pg_advisory_xact_lock_shared(hashtext('stock_ledger'), p_branch);
+
+    select jsonb_agg(jsonb_build_object('branch_id', p_branch, 'product_id', t.product_id,
+                                        'delta', t.target - bs.current_stock, 'reason', 'adjust'))
+    into moves
+    from (
+        select key::uuid as product_id, value::integer as target
+        from jsonb_each_text(targets)
+    ) t
+    join (
+        select product_id, current_stock from branch_stock
+        where branch_id = p_branch
+          and product_id in (select key::uuid from jsonb_object_keys(targets) as key)
+        order by product_id
+        for update
+    ) bs on bs.product_id = t.product_id
+    where t.target <> bs.current_stock;
+
+    perform apply_stock_movements(moves);
+
+    return query
+    select * from branch_products
+    where branch_id = p_branch
+      and id in (select key::uuid from jsonb_object_keys(targets) as key);
+end;
+$$;